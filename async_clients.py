@@ -0,0 +1,87 @@
+import asyncio
+import functools
+
+from distributor_common import get_part_data, get_tme_product, make_tme_part_data
+
+
+class AsyncClient:
+    # asyncio flavour of a blocking client. Every method of the wrapped client is available
+    # as a coroutine of the same name, e.g. await AsyncClient(tme).get_part_details(order_no).
+    # There is no asyncio HTTP library among the dependencies, so the calls run in the event
+    # loop's executor and the sessions, retries, rate limiters and caches of the blocking
+    # clients keep working. At most max_concurrency calls run at a time.
+    # A call cancelled while it waits for its turn is never sent; one already running
+    # finishes in its thread and its result is dropped.
+    def __init__(self, client, max_concurrency=8, executor=None):
+        self.client = client
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.executor = executor
+    
+    async def call(self, func, *args, **kwargs):
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+    
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if not callable(attr):
+            return attr
+        
+        async def method(*args, **kwargs):
+            return await self.call(attr, *args, **kwargs)
+        return method
+
+
+class AsyncPartKeepr(AsyncClient):
+    async def update_part_data(self, part, part_data, distributor, manufacturer_ids_by_name=None):
+        # Same as PartKeepr.update_part_data, but the manufacturer, price and photo
+        # updates are independent of each other and are sent at the same time
+        pk = self.client
+        part_unchanged, price_unchanged = pk.compare_part_data(part, part_data, distributor)
+        if part_unchanged and price_unchanged:
+            print("        Part data unchanged, skipping")
+            pk.discard_photo(part_data)
+            pk.count_avoided_writes(2 if part_data['prices'] else 1)
+            return part
+        
+        manufacturer_ids_by_name = await self.call(pk.get_manufacturer_ids_by_name, manufacturer_ids_by_name)
+        pk.update_part_description(part, part_data)
+        await asyncio.gather(
+            self.call(pk.update_part_manufacturer_data, part, part_data, manufacturer_ids_by_name),
+            self.call(pk.update_part_price, distributor, part_data, price_unchanged),
+            self.call(pk.update_part_photo, part, part_data))
+        pk.update_part_parameters(part, part_data)
+        
+        if part_unchanged:
+            pk.count_avoided_writes()
+            return part
+        return await self.call(pk.update_part, part, pk.PART_DATA_FIELDS)
+
+
+class AsyncDistributors:
+    # asyncio flavour of distributor_common.get_part_data
+    def __init__(self, tme, mouser, digikey, lcsc, max_concurrency=8, executor=None):
+        self.tme = AsyncClient(tme, max_concurrency, executor)
+        self.mouser = AsyncClient(mouser, max_concurrency, executor)
+        self.digikey = AsyncClient(digikey, max_concurrency, executor)
+        self.lcsc = AsyncClient(lcsc, max_concurrency, executor)
+    
+    async def get_part_data(self, distributor, order_no):
+        if distributor == "TME":
+            # The three TME lookups are independent, any failure fails the whole lookup
+            responses = await asyncio.gather(
+                self.tme.get_part_details(order_no),
+                self.tme.get_part_prices(order_no),
+                self.tme.get_part_parameters(order_no))
+            products = []
+            for response, call_name in zip(responses, ("Details", "Prices", "Parameters")):
+                product = get_tme_product(response, call_name)
+                if product is None:
+                    return None
+                products.append(product)
+            return make_tme_part_data(*products)
+        # The other distributors need a single request
+        clients = {"Mouser": self.mouser, "Digi-Key": self.digikey, "LCSC": self.lcsc}
+        if distributor not in clients:
+            return None
+        return await clients[distributor].call(get_part_data, distributor, order_no, self.tme.client, self.mouser.client, self.digikey.client, self.lcsc.client)
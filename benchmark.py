@@ -0,0 +1,305 @@
+import argparse
+import contextlib
+import csv
+import importlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import types
+
+from stand_in_servers import Fixtures, PartKeeprStandIn, TMEStandIn, MouserStandIn, DigiKeyStandIn, LCSCStandIn, get_percentile
+
+
+# Runs the tools end to end against local stand-in servers for PartKeepr and the distributor APIs
+# and reports throughput and latencies. Example:
+#   python benchmark.py --sizes 1000,10000 --latency 0.02 --rate-limit TME=10 --rate-limit Mouser=5
+ACTIONS = ('sync-distributors', 'generate-labels', 'check-stock-from-csv', 'barcode-create-part')
+
+
+class Benchmark:
+    def __init__(self, args):
+        self.args = args
+        self.fixtures = Fixtures(args.fixtures)
+        self.rate_limits = dict([(name, (float(limit), 1.0)) for name, limit in (entry.split("=") for entry in args.rate_limit)])
+        self.servers = []
+        self.credentials = {
+            'PK_BASE_URL': None,
+            'PK_USERNAME': "benchmark",
+            'PK_PASSWORD': "benchmark",
+            'TME_APP_KEY': "benchmark",
+            'TME_APP_SECRET': "benchmark",
+            'MOUSER_API_KEY': "benchmark",
+            'DIGIKEY_CLIENT_ID': "benchmark",
+            'DIGIKEY_CLIENT_SECRET': "benchmark"
+        }
+        os.environ['NO_PROXY'] = "127.0.0.1,localhost"
+    
+    def import_tool(self, name):
+        # The tools copy their credentials from the user's secrets module ("from secrets import *").
+        # A stand-in secrets module is only visible while the tool is imported, then the copied
+        # names are pointed at the stand-in servers. The standard library module stays untouched.
+        saved = sys.modules.get('secrets')
+        stub = types.ModuleType("secrets")
+        stub.__dict__.update(self.credentials)
+        sys.modules['secrets'] = stub
+        try:
+            module = importlib.import_module(name)
+        finally:
+            if saved is not None:
+                sys.modules['secrets'] = saved
+            else:
+                del sys.modules['secrets']
+        for key, value in self.credentials.items():
+            setattr(module, key, value)
+        return module
+    
+    @contextlib.contextmanager
+    def patched(self, owner, name, wrap):
+        # Temporarily replaces owner.name (or owner[name] for dicts) by wrap(original)
+        if isinstance(owner, dict):
+            original = owner[name]
+            owner[name] = wrap(original)
+        else:
+            original = getattr(owner, name)
+            setattr(owner, name, wrap(original))
+        try:
+            yield
+        finally:
+            if isinstance(owner, dict):
+                owner[name] = original
+            else:
+                setattr(owner, name, original)
+    
+    def timed(self, owner, name, latencies):
+        # Records the duration of every call of owner.name
+        def wrap(func):
+            def timed_func(*args, **kwargs):
+                start = time.monotonic()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    latencies.append(time.monotonic() - start)
+            return timed_func
+        return self.patched(owner, name, wrap)
+    
+    def timed_labels(self, label_format, latencies):
+        # Time per label as seen by the output, i.e. the interval between consecutive finished
+        # labels. Raster labels arrive from the worker processes through iter_rendered_cached,
+        # the other formats are produced label by label by their render function.
+        import labels
+        last = [None]
+        
+        def tick():
+            now = time.monotonic()
+            latencies.append(now - last[0])
+            last[0] = now
+        
+        def wrap_writer(writer):
+            def timed_writer(*args, **kwargs):
+                last[0] = time.monotonic()
+                return writer(*args, **kwargs)
+            return timed_writer
+        
+        def wrap_render(func):
+            def timed_render(*args, **kwargs):
+                result = func(*args, **kwargs)
+                tick()
+                return result
+            return timed_render
+        
+        def wrap_iter(func):
+            def timed_iter(*args, **kwargs):
+                for result in func(*args, **kwargs):
+                    tick()
+                    yield result
+            return timed_iter
+        
+        stack = contextlib.ExitStack()
+        stack.enter_context(self.patched(labels.LABEL_FORMATS, label_format, wrap_writer))
+        stack.enter_context(self.patched(labels, 'iter_rendered_cached', wrap_iter))
+        stack.enter_context(self.patched(labels, 'render_vector', wrap_render))
+        stack.enter_context(self.patched(labels, 'render_zpl', wrap_render))
+        return stack
+    
+    def start_servers(self, num_parts):
+        kwargs = lambda name: {'fixtures': self.fixtures, 'latency': self.args.latency, 'jitter': self.args.jitter, 'rate_limit': self.rate_limits.get(name)}
+        pk_server = PartKeeprStandIn(num_parts, parts_per_location=self.args.parts_per_location, **kwargs("PartKeepr")).start()
+        tme_server = TMEStandIn(**kwargs("TME")).start()
+        mouser_server = MouserStandIn(**kwargs("Mouser")).start()
+        digikey_server = DigiKeyStandIn(**kwargs("Digi-Key")).start()
+        lcsc_server = LCSCStandIn(**kwargs("LCSC")).start()
+        self.servers = [pk_server, tme_server, mouser_server, digikey_server, lcsc_server]
+        
+        from tme import TME
+        from mouser import Mouser
+        from digikey import DigiKey
+        from lcsc import LCSC
+        import distributor_common
+        self.credentials['PK_BASE_URL'] = pk_server.url
+        TME.BASE_URL = tme_server.url
+        Mouser.BASE_URL = mouser_server.url
+        DigiKey.BASE_URL = digikey_server.url
+        LCSC.BASE_URL = lcsc_server.url
+        # The clients throttle themselves to the limits of the stand-ins (unlimited if none are set)
+        for name in distributor_common.RATE_LIMITS:
+            distributor_common.RATE_LIMITS[name] = self.rate_limits.get(name, (1000000, 1.0))
+        return pk_server
+    
+    def stop_servers(self):
+        for server in self.servers:
+            server.stop()
+        self.servers = []
+    
+    def prepare_work_dir(self, pk_server):
+        work_dir = tempfile.mkdtemp(prefix="partkeepr-benchmark-")
+        # Digi-Key token that the stand-in accepts, so no interactive authorization is needed
+        with open(os.path.join(work_dir, ".dkauth"), 'w') as f:
+            json.dump({'access_token': "stand-in-token", 'refresh_token': "stand-in-refresh", 'expires_at': time.time() + 86400}, f)
+        # BOM for the stock check, every tenth entry is not in the catalog
+        parts = list(pk_server.collections['parts'].values())
+        with open(os.path.join(work_dir, "bom.csv"), 'w', encoding='utf-8', newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Order No", "Qty"])
+            for i, part in enumerate(parts[:self.args.bom_size]):
+                order_no = part['distributors'][0]['orderNumber'] if i % 10 else "MISSING-{}".format(i)
+                writer.writerow([order_no, 1 + i % 4])
+        return work_dir
+    
+    def run_tool(self, argv):
+        tools = self.import_tool("tools")
+        old_argv = sys.argv
+        sys.argv = ["tools.py"] + argv
+        try:
+            tools.main()
+        finally:
+            sys.argv = old_argv
+    
+    def run_action(self, action, num_parts, pk_server):
+        # Returns the number of items processed and the time per item
+        latencies = []
+        if action == 'sync-distributors':
+            # Per part: merging the distributor data into the part and writing it to PartKeepr
+            import sync
+            with self.timed(sync.DistributorSync, 'write', latencies):
+                self.run_tool(["-a", action, "--journal", "journal.db", "--fetch-workers", str(self.args.fetch_workers), "--write-workers", str(self.args.write_workers), "--partial-updates"])
+            return num_parts, latencies
+        if action == 'generate-labels':
+            with self.timed_labels(self.args.label_format, latencies):
+                self.run_tool(["-a", action, "--label-width", "62", "--label-height", "100", "--label-dpi", "300", "--font-size", "30", "--max-parts-per-label", str(self.args.parts_per_location), "--label-file", "labels.pdf", "--label-format", self.args.label_format])
+            return len(pk_server.collections['storage_locations']), latencies
+        if action == 'check-stock-from-csv':
+            # Per BOM line: looking up the order number
+            import part_index
+            with self.timed(part_index.PartIndex, 'find_by_order_no', latencies):
+                self.run_tool(["-a", action, "--csv-file", "bom.csv", "--order-no-column", "Order No", "--qty-column", "Qty", "--num-boards", "10"])
+            return min(num_parts, self.args.bom_size), latencies
+        if action == 'barcode-create-part':
+            # Per part: scanning the distributor, order number and confirmation codes
+            barcode_client = self.import_tool("barcode_client")
+            from distributor_common import SUPPORTED_DISTRIBUTORS
+            client = barcode_client.BarcodeClient("loop://")
+            codes = list(SUPPORTED_DISTRIBUTORS)
+            for i in range(self.args.barcode_parts):
+                code = codes[i % len(codes)]
+                start = time.monotonic()
+                client.handle_code("D" + code)
+                client.handle_code("NEW-{}-{:06d}".format(code, i))
+                client.handle_code("Y")
+                latencies.append(time.monotonic() - start)
+                if client.state != 'part_scanned':
+                    raise RuntimeError("Creating part {} failed".format(i))
+            return self.args.barcode_parts, latencies
+        raise ValueError(action)
+    
+    def run(self):
+        results = []
+        for num_parts in self.args.sizes:
+            for action in self.args.actions:
+                pk_server = self.start_servers(num_parts)
+                work_dir = self.prepare_work_dir(pk_server)
+                old_cwd = os.getcwd()
+                os.chdir(work_dir)
+                print("Running {} on {} parts".format(action, num_parts), file=sys.stderr)
+                output = sys.stderr if self.args.verbose else io.StringIO()
+                error = None
+                start = time.monotonic()
+                try:
+                    with contextlib.redirect_stdout(output):
+                        num_items, latencies = self.run_action(action, num_parts, pk_server)
+                except SystemExit as e:
+                    # argparse rejected the arguments of the tool
+                    num_items, latencies, error = 0, [], "tool exited with status {}".format(e.code)
+                except Exception as e:
+                    num_items, latencies, error = 0, [], e
+                elapsed = time.monotonic() - start
+                os.chdir(old_cwd)
+                results.append({
+                    'action': action,
+                    'parts': num_parts,
+                    'items': num_items,
+                    'elapsed': elapsed,
+                    'error': error,
+                    'latencies': sorted(latencies),
+                    'servers': [(server.name, server.get_stats()) for server in self.servers]
+                })
+                self.stop_servers()
+                shutil.rmtree(work_dir, ignore_errors=True)
+        return results
+
+
+def print_report(results):
+    print("{:<22} {:>7} {:>9} {:>10} {:>9} {:>10} {:>10}".format("Action", "Parts", "Time [s]", "Items/s", "Requests", "p50 [ms]", "p99 [ms]"))
+    for result in results:
+        num_requests = sum(count for name, stats in result['servers'] for endpoint, count, rejected, p50, p99 in stats)
+        latencies = result['latencies']
+        if result['error']:
+            print("{:<22} {:>7} failed: {}".format(result['action'], result['parts'], result['error']))
+            continue
+        print("{:<22} {:>7} {:>9.2f} {:>10.1f} {:>9} {:>10} {:>10}".format(
+            result['action'],
+            result['parts'],
+            result['elapsed'],
+            result['items'] / result['elapsed'] if result['elapsed'] else 0,
+            num_requests,
+            "{:.2f}".format(get_percentile(latencies, 0.5) * 1000) if latencies else "-",
+            "{:.2f}".format(get_percentile(latencies, 0.99) * 1000) if latencies else "-"))
+    print("p50/p99: Time per item. Sync: writing one part, labels: interval between finished labels,")
+    print("stock check: looking up one BOM line, barcode: scanning and creating one part.")
+    print("")
+    print("Per endpoint (server side, including simulated latency)")
+    print("{:<22} {:>7} {:<45} {:>7} {:>10} {:>10} {:>6}".format("Action", "Parts", "Endpoint", "Calls", "p50 [ms]", "p99 [ms]", "429"))
+    for result in results:
+        for name, stats in result['servers']:
+            for endpoint, count, rejected, p50, p99 in stats:
+                print("{:<22} {:>7} {:<45} {:>7} {:>10.1f} {:>10.1f} {:>6}".format(result['action'], result['parts'], "{} {}".format(name, endpoint), count, p50 * 1000, p99 * 1000, rejected))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=lambda s: [int(n) for n in s.split(",")], default=[1000, 10000, 100000], help="Comma-separated synthetic catalog sizes")
+    parser.add_argument("--actions", type=lambda s: s.split(","), default=list(ACTIONS), help="Comma-separated actions out of: {}".format(", ".join(ACTIONS)))
+    parser.add_argument("--latency", type=float, default=0.02, help="Simulated latency per request in seconds")
+    parser.add_argument("--jitter", type=float, default=0.01, help="Additional random latency per request in seconds")
+    parser.add_argument("--rate-limit", action='append', default=[], help="Requests per second for a stand-in, e.g. TME=10 (can be repeated)")
+    parser.add_argument("--fixtures", type=str, required=False, help="Directory with recorded responses overriding the built-in templates")
+    parser.add_argument("--parts-per-location", type=int, default=5, help="Parts per storage location in the synthetic catalogs")
+    parser.add_argument("--bom-size", type=int, default=200, help="Number of BOM entries for the stock check")
+    parser.add_argument("--barcode-parts", type=int, default=20, help="Number of parts created through the barcode client")
+    parser.add_argument("--label-format", type=str, default='pdf-raster', help="Output format for generate-labels")
+    parser.add_argument("--fetch-workers", type=int, default=2, help="Concurrent requests per distributor for the sync")
+    parser.add_argument("--write-workers", type=int, default=4, help="Concurrent PartKeepr writes for the sync")
+    parser.add_argument("-v", "--verbose", action='store_true', help="Show the output of the tools")
+    args = parser.parse_args()
+    
+    for action in args.actions:
+        if action not in ACTIONS:
+            parser.error("Unknown action {}".format(action))
+    print_report(Benchmark(args).run())
+
+
+if __name__ == "__main__":
+    main()
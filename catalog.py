@@ -0,0 +1,109 @@
+import json
+import sqlite3
+import threading
+import time
+
+
+class Catalog:
+    # Local SQLite copy of the PartKeepr collections that the tools read most
+    COLLECTIONS = ('parts', 'manufacturers', 'distributors', 'storage_locations')
+    
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS entities (collection TEXT NOT NULL, id TEXT NOT NULL, num_id INTEGER, data TEXT NOT NULL, PRIMARY KEY (collection, id))")
+            self.db.execute("CREATE TABLE IF NOT EXISTS sync_state (collection TEXT PRIMARY KEY, synced_at REAL NOT NULL)")
+    
+    def close(self):
+        with self.lock:
+            self.db.close()
+    
+    @staticmethod
+    def get_collection(entity_id):
+        # /api/parts/123 -> parts
+        parts = entity_id.split("/")
+        if len(parts) < 4:
+            return None
+        return parts[2]
+    
+    @staticmethod
+    def get_num_id(entity_id):
+        try:
+            return int(entity_id.split("/")[3])
+        except (IndexError, ValueError):
+            return None
+    
+    def is_tracked(self, entity_id):
+        return self.get_collection(entity_id) in self.COLLECTIONS
+    
+    def get_last_sync(self, collection):
+        with self.lock:
+            row = self.db.execute("SELECT synced_at FROM sync_state WHERE collection = ?", (collection,)).fetchone()
+        return row[0] if row else None
+    
+    def is_synced(self, collection):
+        return self.get_last_sync(collection) is not None
+    
+    def set_last_sync(self, collection, synced_at):
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO sync_state (collection, synced_at) VALUES (?, ?)", (collection, synced_at))
+    
+    def get_all(self, collection):
+        with self.lock:
+            rows = self.db.execute("SELECT data FROM entities WHERE collection = ? ORDER BY num_id", (collection,)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+    
+    def get(self, entity_id):
+        with self.lock:
+            row = self.db.execute("SELECT data FROM entities WHERE collection = ? AND id = ?", (self.get_collection(entity_id), entity_id)).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def put_many(self, entities):
+        rows = []
+        for entity in entities:
+            entity_id = entity['@id']
+            rows.append((self.get_collection(entity_id), entity_id, self.get_num_id(entity_id), json.dumps(entity)))
+        with self.lock, self.db:
+            self.db.executemany("INSERT OR REPLACE INTO entities (collection, id, num_id, data) VALUES (?, ?, ?, ?)", rows)
+    
+    def put(self, entity):
+        if self.is_tracked(entity['@id']):
+            self.put_many([entity])
+    
+    def remove(self, entity_id):
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM entities WHERE collection = ? AND id = ?", (self.get_collection(entity_id), entity_id))
+    
+    def update_collection(self, collection, entities, synced_at=None):
+        # Incremental refresh from the complete server collection: only entities whose data
+        # changed are rewritten and the ones no longer on the server are removed.
+        # Returns the number of (changed, removed) entities.
+        with self.lock:
+            stored = dict(self.db.execute("SELECT id, data FROM entities WHERE collection = ?", (collection,)).fetchall())
+        rows = []
+        seen = set()
+        for entity in entities:
+            entity_id = entity['@id']
+            seen.add(entity_id)
+            data = json.dumps(entity)
+            if stored.get(entity_id) != data:
+                rows.append((collection, entity_id, self.get_num_id(entity_id), data))
+        removed = [(collection, entity_id) for entity_id in stored if entity_id not in seen]
+        with self.lock, self.db:
+            self.db.executemany("INSERT OR REPLACE INTO entities (collection, id, num_id, data) VALUES (?, ?, ?, ?)", rows)
+            self.db.executemany("DELETE FROM entities WHERE collection = ? AND id = ?", removed)
+            self.db.execute("INSERT OR REPLACE INTO sync_state (collection, synced_at) VALUES (?, ?)", (collection, synced_at or time.time()))
+        return len(rows), len(removed)
+    
+    def replace_collection(self, collection, entities, synced_at=None):
+        # Full refresh: drop everything that is no longer on the server
+        rows = []
+        for entity in entities:
+            entity_id = entity['@id']
+            rows.append((collection, entity_id, self.get_num_id(entity_id), json.dumps(entity)))
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM entities WHERE collection = ?", (collection,))
+            self.db.executemany("INSERT INTO entities (collection, id, num_id, data) VALUES (?, ?, ?, ?)", rows)
+            self.db.execute("INSERT OR REPLACE INTO sync_state (collection, synced_at) VALUES (?, ?)", (collection, synced_at or time.time()))
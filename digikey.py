@@ -1,99 +1,187 @@
 import json
-import requests
+import os
+import threading
+import time
 
 from pprint import pprint
 
+from transport import InstrumentedSession
 
-class DigiKey:
-    def __init__(self, client_id, client_secret):
-        self.base_url = "https://api.digikey.com"
-        self.auth_data_file = ".dkauth"
+
+class TokenManager:
+    # Keeps the Digi-Key OAuth token fresh for concurrent callers. Tokens are refreshed in the
+    # background shortly before they expire; callers that need a refresh while one is running
+    # wait for it on the lock instead of refreshing again. Interactive authorization is only
+    # done on the main thread, other threads just report that it is needed.
+    def __init__(self, digikey, auth_data_file, refresh_margin=120):
+        self.digikey = digikey
+        self.auth_data_file = auth_data_file
         self.auth_data = None
-        self.client_id = client_id
-        self.client_secret = client_secret
+        self.refresh_margin = refresh_margin
+        self.lock = threading.RLock()
+        self.stop_event = threading.Event()
+        self.refresh_thread = None
+    
+    def load_auth_data(self):
+        try:
+            # Get existing token from file
+            with open(self.auth_data_file, 'r') as f:
+                self.auth_data = json.load(f)
+            return True
+        except FileNotFoundError:
+            return False
     
     def save_auth_data(self):
-        with open(self.auth_data_file, 'w') as f:
-                json.dump(self.auth_data, f)
+        # Write to a temporary file and rename so the token file is never left half-written
+        tmp_file = self.auth_data_file + ".tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(self.auth_data, f)
+        os.replace(tmp_file, self.auth_data_file)
+    
+    def set_auth_data(self, response):
+        self.auth_data = {
+            'access_token': response['access_token'],
+            'refresh_token': response['refresh_token'],
+            # Older token files have no expiry, those tokens are only refreshed when rejected
+            'expires_at': time.time() + response['expires_in'] if 'expires_in' in response else None
+        }
+        self.save_auth_data()
+    
+    def request_token(self, data):
+        data['client_id'] = self.digikey.client_id
+        data['client_secret'] = self.digikey.client_secret
+        resp = self.digikey.session.post(self.digikey.base_url + "/v1/oauth2/token", data=data)
+        response = resp.json()
+        if 'access_token' in response:
+            self.set_auth_data(response)
+            return True
+        return False
+    
+    def can_prompt(self):
+        # The authorization code is entered on the console, which only the main thread may use
+        return threading.current_thread() is threading.main_thread()
     
     def authorize(self, force_reauth=False):
-        reauth = force_reauth
-        if not force_reauth:
-            try:
-                # Get existing token from file
-                with open(self.auth_data_file, 'r') as f:
-                    self.auth_data = json.load(f)
-                return True
-            except FileNotFoundError:
-                reauth = True
-        
-        if reauth:
-            # Obtain Access Token
-            print("Please visit the following URL in your browser to obtain an Authorization Code: https://api.digikey.com/v1/oauth2/authorize?response_type=code&client_id={}&redirect_uri=https%3A%2F%2Fexample.com".format(self.client_id))
-            auth_code = input("Please enter the authorization code: ")
-            data = {
-                'code': auth_code,
-                'client_id': self.client_id,
-                'client_secret': self.client_secret,
-                'redirect_uri': "https://example.com",
-                'grant_type': 'authorization_code'
-            }
-            resp = requests.post(self.base_url + "/v1/oauth2/token", data=data)
-            response = resp.json()
-            if 'access_token' in response:
-                self.auth_data = {
-                    'access_token': response['access_token'],
-                    'refresh_token': response['refresh_token']
-                }
-                self.save_auth_data()
+        with self.lock:
+            if not force_reauth and self.load_auth_data():
                 return True
+        if not self.can_prompt():
+            print("Digi-Key authorization required, run the tool again to authorize!")
             return False
         
-    def refresh_access_token(self):
-        if not self.auth_data:
-            return
-        
+        # Obtain Access Token, the other callers are not blocked while waiting for the input
+        print("Please visit the following URL in your browser to obtain an Authorization Code: https://api.digikey.com/v1/oauth2/authorize?response_type=code&client_id={}&redirect_uri=https%3A%2F%2Fexample.com".format(self.digikey.client_id))
+        auth_code = input("Please enter the authorization code: ")
         data = {
-            'client_id': self.client_id,
-            'client_secret': self.client_secret,
-            'refresh_token': self.auth_data['refresh_token'],
-            'grant_type': 'refresh_token'
+            'code': auth_code,
+            'redirect_uri': "https://example.com",
+            'grant_type': 'authorization_code'
         }
-        resp = requests.post(self.base_url + "/v1/oauth2/token", data=data)
-        response = resp.json()
-        if 'access_token' in response:
-            self.auth_data = {
-                'access_token': response['access_token'],
-                'refresh_token': response['refresh_token']
+        with self.lock:
+            return self.request_token(data)
+    
+    def refresh_access_token(self):
+        with self.lock:
+            if not self.auth_data:
+                return False
+            data = {
+                'refresh_token': self.auth_data['refresh_token'],
+                'grant_type': 'refresh_token'
             }
-            self.save_auth_data()
-            return True
-        else:
-            # Failed to refresh, completely re-auth
-            return self.authorize(force_reauth=True)
-        return False
+            if self.request_token(data):
+                return True
+        # Failed to refresh, completely re-auth (only possible from the main thread)
+        return self.authorize(force_reauth=True)
     
-    def api_call(self, url, data=None, retry=True):
-        if not self.auth_data:
-            success = self.authorize()
-            if not success:
+    def needs_refresh(self):
+        expires_at = self.auth_data.get('expires_at')
+        return expires_at is not None and time.time() >= expires_at - self.refresh_margin
+    
+    def get_access_token(self):
+        if not self.auth_data and not self.authorize():
+            return None
+        with self.lock:
+            if self.needs_refresh() and not self.refresh_access_token():
                 return None
+            self.start_refresh_thread()
+            return self.auth_data['access_token']
+    
+    def invalidate(self, access_token):
+        # Called when the API rejected access_token. Only the first caller refreshes,
+        # the others find a different token by the time they get the lock.
+        with self.lock:
+            if self.auth_data and self.auth_data['access_token'] != access_token:
+                return True
+            return self.refresh_access_token()
+    
+    def start_refresh_thread(self):
+        if self.refresh_thread is None:
+            self.refresh_thread = threading.Thread(target=self.refresh_loop, daemon=True)
+            self.refresh_thread.start()
+    
+    def stop(self):
+        self.stop_event.set()
+    
+    def refresh_loop(self):
+        while not self.stop_event.is_set():
+            with self.lock:
+                expires_at = self.auth_data.get('expires_at') if self.auth_data else None
+            if expires_at is None:
+                wait = 60
+            else:
+                wait = max(0, expires_at - self.refresh_margin - time.time())
+            if self.stop_event.wait(wait):
+                return
+            with self.lock:
+                if self.auth_data and self.needs_refresh():
+                    print("Refreshing Digi-Key Access Token")
+                    if not self.request_token({'refresh_token': self.auth_data['refresh_token'], 'grant_type': 'refresh_token'}):
+                        # Leave interactive re-authorization to the next API call
+                        print("Failed to refresh Digi-Key Access Token!")
+                        self.auth_data['expires_at'] = None
+
+
+class DigiKey:
+    # Can be pointed at a stand-in server, e.g. by the benchmark
+    BASE_URL = "https://api.digikey.com"
+    
+    def __init__(self, client_id, client_secret, rate_limiter=None, cache=None, pool_size=8, timeout=30):
+        self.base_url = self.BASE_URL
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        self.session = InstrumentedSession(pool_size=pool_size, timeout=timeout)
+        self.tokens = TokenManager(self, ".dkauth")
+    
+    def authorize(self, force_reauth=False):
+        return self.tokens.authorize(force_reauth)
+    
+    def refresh_access_token(self):
+        return self.tokens.refresh_access_token()
+    
+    def api_call(self, url, data=None, retry=True):
+        access_token = self.tokens.get_access_token()
+        if not access_token:
+            return None
         
         headers = {
             'accept': 'application/json',
-            'Authorization': "Bearer {}".format(self.auth_data['access_token']),
+            'Authorization': "Bearer {}".format(access_token),
             'X-DIGIKEY-Client-Id': self.client_id,
             'X-DIGIKEY-Locale-Site': 'DE',
             'X-DIGIKEY-Locale-Language': 'en',
             'X-DIGIKEY-Locale-Currency': 'EUR',
             'X-DIGIKEY-Customer-Id': "0",
         }
-        resp = requests.get(self.base_url + url, headers=headers, data=data)
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+        resp = self.session.get(self.base_url + url, headers=headers, data=data)
         if resp.status_code != 200:
             return None
         response = resp.json()
         if 'ErrorMessage' in response and response['ErrorMessage'] in ("Bearer token  expired", "The Bearer token is invalid"):
-            success = self.refresh_access_token()
+            success = self.tokens.invalidate(access_token)
             if not success:
                 print("Failed to refresh Digi-Key Access Token!")
                 return None
@@ -104,4 +192,11 @@ class DigiKey:
             return response
     
     def get_part_details(self, order_no):
-        return self.api_call("/Search/v3/Products/{}".format(order_no))
+        if self.cache:
+            data = self.cache.get("Digi-Key", 'part', order_no.upper())
+            if data is not None:
+                return data
+        data = self.api_call("/Search/v3/Products/{}".format(order_no))
+        if self.cache and data is not None and 'ErrorMessage' not in data:
+            self.cache.put("Digi-Key", 'part', order_no.upper(), data)
+        return data
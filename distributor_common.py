@@ -1,4 +1,12 @@
-import requests
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from pprint import pprint
+
+from mouser import Mouser
+from photos import PhotoPipeline
+from tme import TME
 
 
 SUPPORTED_DISTRIBUTORS = {
@@ -8,58 +16,208 @@ SUPPORTED_DISTRIBUTORS = {
     "LCSC": "LCSC"
 }
 
+# Distributors that support looking up several order numbers per request
+BATCH_SIZES = {
+    "TME": TME.MAX_SYMBOLS,
+    "Mouser": Mouser.MAX_PART_NUMBERS
+}
+
+# Allowed API calls per time period in seconds for each distributor
+RATE_LIMITS = {
+    "TME": (5, 1.0),
+    "Mouser": (30, 60.0),
+    "Digi-Key": (120, 60.0),
+    "LCSC": (5, 1.0)
+}
+
+
+class RateLimiter:
+    # Token bucket, safe to share between threads
+    def __init__(self, calls, period):
+        self.capacity = calls
+        self.fill_rate = calls / period
+        self.tokens = calls
+        self.last_fill = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_fill) * self.fill_rate)
+                self.last_fill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.fill_rate
+            time.sleep(wait)
+
+
+def get_rate_limiter(distributor):
+    return RateLimiter(*RATE_LIMITS[distributor])
+
+
+photo_pipeline = None
+photo_pipeline_lock = threading.Lock()
+
+
+def get_photo_pipeline(session):
+    # One pipeline per process so photos are shared between all lookups
+    global photo_pipeline
+    with photo_pipeline_lock:
+        if photo_pipeline is None:
+            photo_pipeline = PhotoPipeline(session)
+        return photo_pipeline
+
+
+tme_executor = None
+tme_executor_lock = threading.Lock()
+
+
+def get_tme_executor():
+    # Shared by all TME lookups of the process for the calls that run next to each other
+    global tme_executor
+    with tme_executor_lock:
+        if tme_executor is None:
+            tme_executor = ThreadPoolExecutor(max_workers=4)
+        return tme_executor
+
+
+def get_tme_product(response, call_name):
+    # Returns the first product of a TME response, or None after reporting the error
+    if response is None:
+        print("        TME Part {} API Error!".format(call_name))
+        return None
+    if 'Error' in response:
+        print("        TME Part {} API Error: {}".format(call_name, response['Status']))
+        return None
+    return response['Data']['ProductList'][0]
+
+
+def make_tme_part_data(tme_data, tme_prices, tme_parameters):
+    prices = []
+    for entry in tme_prices['PriceList']:
+        prices.append({'quantity': entry['Amount'], 'price': entry['PriceValue']})
+    
+    parameters = {}
+    for entry in tme_parameters['ParameterList']:
+        parameters[entry['ParameterName']] = entry['ParameterValue']
+    
+    part_data = {
+        'description': tme_data['Description'],
+        'manufacturer': tme_data['Producer'],
+        'manufacturer_part_no': tme_data['OriginalSymbol'] or tme_data['Symbol'],
+        'photo': tme_data.get('Photo'),
+        'parameters': parameters,
+        'prices': prices
+    }
+    if part_data['photo'] and part_data['photo'].startswith("//"):
+        part_data['photo'] = "https:" + part_data['photo']
+    return part_data
+
+
+def get_tme_parts_data(order_nos, tme):
+    # Fetches many TME parts with three requests per 50 symbols.
+    # Returns part data keyed by order number, None for parts that could not be found.
+    tme_data = tme.get_parts_details(order_nos)
+    if tme_data is None:
+        print("        TME Part Details API Error!")
+        return dict([(order_no, None) for order_no in order_nos])
+    tme_prices = tme.get_parts_prices(order_nos)
+    if tme_prices is None:
+        print("        TME Part Prices API Error!")
+        return dict([(order_no, None) for order_no in order_nos])
+    tme_parameters = tme.get_parts_parameters(order_nos)
+    if tme_parameters is None:
+        print("        TME Part Parameters API Error!")
+        return dict([(order_no, None) for order_no in order_nos])
+    
+    # TME may normalize the case of the returned symbols
+    tme_data = dict([(symbol.upper(), entry) for symbol, entry in tme_data.items()])
+    tme_prices = dict([(symbol.upper(), entry) for symbol, entry in tme_prices.items()])
+    tme_parameters = dict([(symbol.upper(), entry) for symbol, entry in tme_parameters.items()])
+    
+    result = {}
+    for order_no in order_nos:
+        symbol = order_no.upper()
+        if symbol not in tme_data or symbol not in tme_prices or symbol not in tme_parameters:
+            print("        Could not find TME part {}!".format(order_no))
+            result[order_no] = None
+            continue
+        result[order_no] = make_tme_part_data(tme_data[symbol], tme_prices[symbol], tme_parameters[symbol])
+    return result
+
+
+def make_mouser_part_data(mouser_part):
+    prices = []
+    for entry in mouser_part['PriceBreaks']:
+        price = float(entry['Price'].split()[0].replace(",", "."))
+        prices.append({'quantity': entry['Quantity'], 'price': price})
+    
+    part_data = {
+        'description': mouser_part['Description'],
+        'manufacturer': mouser_part['Manufacturer'],
+        'manufacturer_part_no': mouser_part['ManufacturerPartNumber'],
+        'photo': mouser_part.get('ImagePath'),
+        'parameters': None,
+        'prices': prices
+    }
+    return part_data
+
+
+def get_mouser_parts_data(order_nos, mouser):
+    # Looks up to 10 Mouser parts per request.
+    # Returns part data keyed by order number, None for parts that could not be found.
+    mouser_parts = mouser.get_parts_details(order_nos)
+    if mouser_parts is None:
+        print("        Mouser Part Details API Error!")
+        return dict([(order_no, None) for order_no in order_nos])
+    
+    # A search can return similar part numbers as well, only use exact matches
+    mouser_parts = dict([(part_no.upper(), part) for part_no, part in mouser_parts.items()])
+    
+    result = {}
+    for order_no in order_nos:
+        if order_no.upper() not in mouser_parts:
+            print("        Could not find Mouser part {}!".format(order_no))
+            result[order_no] = None
+            continue
+        result[order_no] = make_mouser_part_data(mouser_parts[order_no.upper()])
+    return result
+
+
+def get_parts_data(distributor, order_nos, tme, mouser, digikey, lcsc):
+    # Batch entry point, returns part data keyed by order number
+    if distributor == "TME":
+        return get_tme_parts_data(order_nos, tme)
+    if distributor == "Mouser":
+        return get_mouser_parts_data(order_nos, mouser)
+    return dict([(order_no, get_part_data(distributor, order_no, tme, mouser, digikey, lcsc)) for order_no in order_nos])
+
 
 def get_part_data(distributor, order_no, tme, mouser, digikey, lcsc):
     if distributor == "TME":
-        tme_data = tme.get_part_details(order_no)
-        if tme_data is None:
-            print("        TME Part Details API Error!")
-            return None
-        if 'Error' in tme_data:
-            print("        TME Part Details API Error: {}".format(tme_data['Status']))
-            return None
-        else:
-            tme_data = tme_data['Data']['ProductList'][0]
-        
-        tme_prices = tme.get_part_prices(order_no)
-        if tme_prices is None:
-            print("        TME Part Prices API Error!")
-            return None
-        if 'Error' in tme_prices:
-            print("        TME Part Prices API Error: {}".format(tme_prices['Status']))
-            return None
-        else:
-            tme_prices = tme_prices['Data']['ProductList'][0]
-        
-        prices = []
-        for entry in tme_prices['PriceList']:
-            prices.append({'quantity': entry['Amount'], 'price': entry['PriceValue']})
+        # The three lookups are independent and sent at the same time (two on the shared executor,
+        # one from this thread). Any failure fails the whole lookup and the other results are discarded.
+        executor = get_tme_executor()
+        details_future = executor.submit(tme.get_part_details, order_no)
+        parameters_future = executor.submit(tme.get_part_parameters, order_no)
+        try:
+            tme_prices = get_tme_product(tme.get_part_prices(order_no), "Prices")
+            if tme_prices is None:
+                return None
+            tme_data = get_tme_product(details_future.result(), "Details")
+            if tme_data is None:
+                return None
+            tme_parameters = get_tme_product(parameters_future.result(), "Parameters")
+            if tme_parameters is None:
+                return None
+        finally:
+            # Calls that did not start yet are not needed anymore
+            details_future.cancel()
+            parameters_future.cancel()
         
-        tme_parameters = tme.get_part_parameters(order_no)
-        if tme_parameters is None:
-            print("        TME Part Parameters API Error!")
-            return None
-        if 'Error' in tme_parameters:
-            print("        TME Part Parameters API Error: {}".format(tme_parameters['Status']))
-            return None
-        else:
-            tme_parameters = tme_parameters['Data']['ProductList'][0]
-        
-        parameters = {}
-        for entry in tme_parameters['ParameterList']:
-            parameters[entry['ParameterName']] = entry['ParameterValue']
-        
-        part_data = {
-            'description': tme_data['Description'],
-            'manufacturer': tme_data['Producer'],
-            'manufacturer_part_no': tme_data['OriginalSymbol'] or tme_data['Symbol'],
-            'photo': tme_data.get('Photo'),
-            'parameters': parameters,
-            'prices': prices
-        }
-        if part_data['photo'].startswith("//"):
-            part_data['photo'] = "https:" + part_data['photo']
-        return part_data
+        return make_tme_part_data(tme_data, tme_prices, tme_parameters)
     elif distributor == "Mouser":
         mouser_data = mouser.get_part_details(order_no)
         if mouser_data is None:
@@ -73,21 +231,7 @@ def get_part_data(distributor, order_no, tme, mouser, digikey, lcsc):
             print("        Could not find part!")
             return None
         mouser_part = mouser_data['SearchResults']['Parts'][0]
-        
-        prices = []
-        for entry in mouser_part['PriceBreaks']:
-            price = float(entry['Price'].split()[0].replace(",", "."))
-            prices.append({'quantity': entry['Quantity'], 'price': price})
-        
-        part_data = {
-            'description': mouser_part['Description'],
-            'manufacturer': mouser_part['Manufacturer'],
-            'manufacturer_part_no': mouser_part['ManufacturerPartNumber'],
-            'photo': mouser_part.get('ImagePath'),
-            'parameters': None,
-            'prices': prices
-        }
-        return part_data
+        return make_mouser_part_data(mouser_part)
     elif distributor == "Digi-Key":
         digikey_data = digikey.get_part_details(order_no)
         if digikey_data is None:
@@ -116,13 +260,9 @@ def get_part_data(distributor, order_no, tme, mouser, digikey, lcsc):
         }
         
         # For some reason, with Digi-Key, PartKeepr only downloads a "Access Denied" page instead of the photo
-        # so we download it ourselves
+        # so we download it ourselves. The download runs in the background until the photo is uploaded.
         if 'PrimaryPhoto' in digikey_data:
-            url = digikey_data['PrimaryPhoto']
-            filename = url.split("/")[-1]
-            with open(filename, 'wb') as f:
-                f.write(requests.get(url).content)
-            part_data['photo'] = open(filename, 'rb')
+            part_data['photo'] = get_photo_pipeline(digikey.session).fetch(digikey_data['PrimaryPhoto'])
         
         return part_data
     elif distributor == "LCSC":
@@ -0,0 +1,126 @@
+import code128
+import os
+import pickle
+import PIL
+import zlib
+
+from collections import OrderedDict
+from PIL import Image, ImageFont
+
+
+class LRUCache:
+    # Dictionary that drops the least recently used entries once it holds more than maxsize
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+    
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+    
+    def items(self):
+        return list(self.entries.items())
+
+
+class RenderCache:
+    # Memoizes the expensive parts of rendering raster labels: loaded fonts, barcode bitmaps and
+    # rendered texts. Entries are keyed by their content and geometry, so a label that did not
+    # change is put together from cached bitmaps only. Barcodes and texts can be saved to disk
+    # and loaded on the next run; the file is ignored if it was written by another Pillow version,
+    # since the text rendering may differ between versions.
+    FILE_VERSION = 1
+    
+    def __init__(self, max_barcodes=10000, max_texts=20000):
+        self.fonts = {}
+        self.barcodes = LRUCache(max_barcodes)
+        self.texts = LRUCache(max_texts)
+        # Entries added since the last call to take_new_entries(), only collected if enabled, e.g.
+        # in worker processes whose entries are merged into the cache of the main process
+        self.track_new = False
+        self.new_entries = []
+    
+    def get_font(self, font_file, font_size):
+        key = (font_file, font_size)
+        if key not in self.fonts:
+            self.fonts[key] = ImageFont.truetype(font_file, font_size)
+        return self.fonts[key]
+    
+    def add(self, kind, key, value):
+        (self.barcodes if kind == 'barcode' else self.texts).put(key, value)
+        if self.track_new:
+            self.new_entries.append((kind, key, value))
+    
+    def get_barcode(self, data, height, thickness):
+        # All rows of a barcode are the same, so only one row is kept per barcode and stretched to the height
+        key = (data, thickness)
+        row = self.barcodes.get(key)
+        if row is None:
+            row = code128.image(data, height=1, thickness=thickness, quiet_zone=False)
+            self.add('barcode', key, row)
+        return row.resize((row.size[0], height), Image.NEAREST)
+    
+    def get_text(self, font_file, font_size, text, start):
+        # Returns the antialiased text as mask image and its offset from the text position,
+        # start is the fractional part of the position as in ImageDraw.text().
+        # The masks are mostly empty and kept compressed.
+        key = (font_file, font_size, text, start)
+        entry = self.texts.get(key)
+        if entry is None:
+            mask, offset = self.get_font(font_file, font_size).getmask2(text, "L", start=start)
+            # getmask2() returns the bare image storage, wrap it into an Image
+            mask = Image.Image()._new(mask)
+            self.add('text', key, (mask.size, offset, zlib.compress(mask.tobytes(), 1)))
+            return mask, offset
+        size, offset, data = entry
+        return Image.frombytes("L", size, zlib.decompress(data)), offset
+    
+    def take_new_entries(self):
+        entries = self.new_entries
+        self.new_entries = []
+        return entries
+    
+    def merge(self, entries):
+        for kind, key, value in entries:
+            self.add(kind, key, value)
+    
+    def load(self, filename):
+        try:
+            with open(filename, 'rb') as f:
+                data = pickle.loads(zlib.decompress(f.read()))
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print("Ignoring unreadable render cache {}: {}".format(filename, e))
+            return
+        if data.get('version') != self.FILE_VERSION or data.get('pillow') != PIL.__version__:
+            return
+        for key, value in data['barcodes']:
+            self.barcodes.put(key, value)
+        for key, value in data['texts']:
+            self.texts.put(key, value)
+    
+    def save(self, filename):
+        data = {
+            'version': self.FILE_VERSION,
+            'pillow': PIL.__version__,
+            'barcodes': self.barcodes.items(),
+            'texts': self.texts.items()
+        }
+        # Write to a temporary file and rename so the cache is never left half-written
+        tmp_file = filename + ".tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(zlib.compress(pickle.dumps(data, pickle.HIGHEST_PROTOCOL), 3))
+        os.replace(tmp_file, filename)
@@ -0,0 +1,446 @@
+import hashlib
+import json
+import math
+import os
+import re
+import socket
+import struct
+import zlib
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from code128.format import code128_format
+from PIL import Image, ImageFont
+
+from label_cache import RenderCache
+from pdf_writer import PDFWriter
+
+
+# Font bundled with the tools, used for all label formats
+FONT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "label-font", "LiberationSans-Regular.ttf")
+
+
+class LabelGeometry:
+    # Label size and text settings, label dimensions in millimeters
+    def __init__(self, width, height, dpi, font_size, font_file=FONT_FILE):
+        self.width = width
+        self.height = height
+        self.dpi = dpi
+        self.font_size = font_size
+        self.font_file = font_file
+        self.width_px = round((width / 25.4) * dpi)
+        self.height_px = round((height / 25.4) * dpi)
+
+
+def get_label_jobs(index, max_parts_per_label, location=None):
+    # Returns (location name, [(part ID, text), ...]) for every label to generate, sorted by location
+    jobs = []
+    for loc_name in sorted(index.get_locations()):
+        if location and loc_name.lower() != location.lower():
+            continue
+        parts = index.get_parts_by_location(loc_name)
+        if len(parts) > max_parts_per_label:
+            print("Skipping storage location {}: {} parts".format(loc_name, len(parts)))
+            continue
+        print("Processing storage location {}: {} parts".format(loc_name, len(parts)))
+        jobs.append((loc_name, [(part['@id'].split("/")[-1], "{}: {}".format(part['category']['name'], part['name'])) for part in sorted(parts, key=lambda p: p['@id'])]))
+    return jobs
+
+
+class LabelManifest:
+    # Remembers a hash of everything that ends up on each location's label (part IDs, category
+    # and part names, label geometry), so only labels that changed need to be printed again
+    def __init__(self, filename):
+        self.filename = filename
+        try:
+            with open(filename, 'r') as f:
+                self.hashes = json.load(f)
+        except FileNotFoundError:
+            self.hashes = {}
+    
+    @staticmethod
+    def get_hash(job, geometry):
+        loc_name, parts = job
+        data = {
+            'location': loc_name,
+            'parts': parts,
+            'geometry': [geometry.width, geometry.height, geometry.dpi, geometry.font_size]
+        }
+        return hashlib.sha1(json.dumps(data).encode('utf-8')).hexdigest()
+    
+    def get_changed(self, jobs, geometry):
+        return [job for job in jobs if self.hashes.get(job[0]) != self.get_hash(job, geometry)]
+    
+    def update(self, jobs, geometry, prune=False):
+        # prune: jobs holds every current label, entries of other locations are dropped
+        if prune:
+            self.hashes = {}
+        for job in jobs:
+            self.hashes[job[0]] = self.get_hash(job, geometry)
+    
+    def save(self):
+        # Write to a temporary file and rename so the manifest is never left half-written
+        tmp_file = self.filename + ".tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(self.hashes, f, indent=1, sort_keys=True)
+        os.replace(tmp_file, self.filename)
+
+
+def layout_label(loc_name, parts, geometry):
+    # Positions of everything on a label in pixels, shared by all output backends
+    margin = round(max(geometry.height_px * 0.02, geometry.width_px * 0.02))
+    avail_label_height = geometry.height_px - 2 * margin
+    avail_label_width = geometry.width_px - 2 * margin
+    
+    # Split label into base grid with fixed height location tag and variable height parts areas
+    base_x = margin
+    loc_area_y = margin
+    loc_area_height = round(geometry.font_size * 1.5)
+    parts_area_y = loc_area_y + loc_area_height
+    parts_area_height = avail_label_height - loc_area_height
+    
+    # Split parts area into evenly-spaced grid
+    parts_area_region_height = parts_area_height // len(parts)
+    
+    layout = {
+        'width': geometry.width_px,
+        'height': geometry.height_px,
+        'font_size': geometry.font_size,
+        'texts': [(base_x, loc_area_y, "Location: {}".format(loc_name))],
+        'barcodes': []
+    }
+    for i, (part_id, barcode_text) in enumerate(parts):
+        barcode_height = parts_area_region_height - round(geometry.font_size * 1.5)
+        barcode_thickness = avail_label_width // 100
+        
+        data = "P" + part_id
+        bars = code128_format(data, barcode_thickness)
+        barcode_x = (avail_label_width - sum(bars)) // 2
+        barcode_y = parts_area_y + parts_area_region_height * i
+        layout['barcodes'].append({
+            'data': data,
+            'x': barcode_x,
+            'y': barcode_y,
+            'height': barcode_height,
+            'thickness': barcode_thickness,
+            'bars': bars
+        })
+        
+        name_x = barcode_x
+        name_y = barcode_y + barcode_height + geometry.font_size * 0.1
+        layout['texts'].append((name_x, name_y, barcode_text))
+    return layout
+
+
+# Fonts, barcodes and texts rendered by the current (worker) process
+render_cache = RenderCache()
+
+
+def init_render_worker(cache_file):
+    # Worker processes start from the cache saved by the last run and report their new entries
+    # back with each page, so the main process can save them for the next run
+    render_cache.load(cache_file)
+    render_cache.track_new = True
+
+
+def render_raster(layout, geometry):
+    img = Image.new("L", (layout['width'], layout['height']), 'white')
+    for barcode in layout['barcodes']:
+        img.paste(render_cache.get_barcode(barcode['data'], barcode['height'], barcode['thickness']), (barcode['x'], barcode['y']))
+    for x, y, text in layout['texts']:
+        # Same placement as ImageDraw.text(), which renders the fractional part of the position into the mask
+        mask, offset = render_cache.get_text(geometry.font_file, geometry.font_size, text, (math.modf(x)[0], math.modf(y)[0]))
+        x = int(x) + offset[0]
+        y = int(y) + offset[1]
+        img.paste(0, (x, y, x + mask.size[0], y + mask.size[1]), mask)
+    return img
+
+
+def render_raster_page(job, geometry):
+    # Runs in a worker process, only the compressed pixels and new cache entries are sent back.
+    # Level 3 is several times faster than the default and compresses the mostly white labels better.
+    loc_name, parts = job
+    img = render_raster(layout_label(loc_name, parts, geometry), geometry)
+    return (img.size[0], img.size[1], zlib.compress(img.tobytes(), 3), render_cache.take_new_entries())
+
+
+def iter_rendered(render, jobs, geometry, workers=None, initializer=None, initargs=()):
+    # Renders the jobs in a process pool and yields the results in job order. At most two
+    # jobs per worker are in flight, so memory use does not grow with the number of labels.
+    workers = workers or os.cpu_count() or 1
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as executor:
+        for job in jobs:
+            pending.append(executor.submit(render, job, geometry))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def iter_rendered_cached(render, jobs, geometry, workers=None, cache_file=None):
+    # iter_rendered() for renderers that use the render cache and return its new entries last.
+    # cache_file: Render cache kept between runs, see label_cache.RenderCache
+    cache = RenderCache()
+    if cache_file:
+        cache.load(cache_file)
+    for result in iter_rendered(render, jobs, geometry, workers, init_render_worker if cache_file else None, (cache_file,)):
+        cache.merge(result[-1])
+        yield result[:-1]
+    if cache_file:
+        cache.save(cache_file)
+
+
+def write_raster_pdf(filename, jobs, geometry, workers=None, cache_file=None):
+    pdf = PDFWriter(filename)
+    try:
+        for width, height, data in iter_rendered_cached(render_raster_page, jobs, geometry, workers, cache_file):
+            pdf.add_raster_page(width, height, geometry.dpi, data, compressed=True)
+    finally:
+        pdf.close()
+
+
+class TrueTypeFont:
+    # The few tables of a TrueType file needed to embed it into a PDF
+    def __init__(self, data):
+        self.data = data
+        num_tables = struct.unpack(">H", data[4:6])[0]
+        self.tables = {}
+        for i in range(num_tables):
+            tag, checksum, offset, length = struct.unpack(">4sIII", data[12 + 16 * i:28 + 16 * i])
+            self.tables[tag.decode('latin-1')] = offset
+        
+        head = self.tables['head']
+        self.units_per_em = struct.unpack(">H", data[head + 18:head + 20])[0]
+        self.bbox = [self.scale(v) for v in struct.unpack(">hhhh", data[head + 36:head + 44])]
+        hhea = self.tables['hhea']
+        ascender, descender = struct.unpack(">hh", data[hhea + 4:hhea + 8])
+        self.ascent = self.scale(ascender)
+        self.descent = self.scale(descender)
+        num_h_metrics = struct.unpack(">H", data[hhea + 34:hhea + 36])[0]
+        num_glyphs = struct.unpack(">H", data[self.tables['maxp'] + 4:self.tables['maxp'] + 6])[0]
+        hmtx = self.tables['hmtx']
+        advances = [struct.unpack(">H", data[hmtx + 4 * i:hmtx + 4 * i + 2])[0] for i in range(num_h_metrics)]
+        self.widths = [self.scale(advances[min(i, num_h_metrics - 1)]) for i in range(num_glyphs)]
+        self.glyph_ids = self.read_cmap()
+    
+    def scale(self, value):
+        # Font units to PDF glyph space (1/1000 em)
+        return round(value * 1000 / self.units_per_em)
+    
+    def read_cmap(self):
+        # Unicode BMP -> glyph ID from the format 4 Windows Unicode subtable
+        data = self.data
+        cmap = self.tables['cmap']
+        num_subtables = struct.unpack(">H", data[cmap + 2:cmap + 4])[0]
+        for i in range(num_subtables):
+            platform_id, encoding_id, offset = struct.unpack(">HHI", data[cmap + 4 + 8 * i:cmap + 12 + 8 * i])
+            table = cmap + offset
+            if platform_id == 3 and encoding_id == 1 and struct.unpack(">H", data[table:table + 2])[0] == 4:
+                break
+        else:
+            return {}
+        
+        seg_count = struct.unpack(">H", data[table + 6:table + 8])[0] // 2
+        end_codes = table + 14
+        start_codes = end_codes + 2 * seg_count + 2
+        id_deltas = start_codes + 2 * seg_count
+        id_range_offsets = id_deltas + 2 * seg_count
+        glyph_ids = {}
+        for seg in range(seg_count):
+            end_code = struct.unpack(">H", data[end_codes + 2 * seg:end_codes + 2 * seg + 2])[0]
+            start_code = struct.unpack(">H", data[start_codes + 2 * seg:start_codes + 2 * seg + 2])[0]
+            id_delta = struct.unpack(">h", data[id_deltas + 2 * seg:id_deltas + 2 * seg + 2])[0]
+            range_offset_pos = id_range_offsets + 2 * seg
+            id_range_offset = struct.unpack(">H", data[range_offset_pos:range_offset_pos + 2])[0]
+            for code in range(start_code, min(end_code, 0xFFFE) + 1):
+                if id_range_offset == 0:
+                    glyph_id = (code + id_delta) & 0xFFFF
+                else:
+                    pos = range_offset_pos + id_range_offset + 2 * (code - start_code)
+                    glyph_id = struct.unpack(">H", data[pos:pos + 2])[0]
+                    if glyph_id:
+                        glyph_id = (glyph_id + id_delta) & 0xFFFF
+                if glyph_id:
+                    glyph_ids[code] = glyph_id
+        return glyph_ids
+
+
+class PDFFont:
+    # TrueType font embedded into a PDF as a composite font addressed by glyph ID,
+    # so any character in the font can be used (e.g. the Ω in resistor names)
+    def __init__(self, pdf, font_file, name="F1"):
+        self.name = name
+        with open(font_file, 'rb') as f:
+            font = TrueTypeFont(f.read())
+        self.glyph_ids = font.glyph_ids
+        # Texts are positioned by their ascender line like PIL does, so use the same ascent as PIL
+        self.ascent = ImageFont.truetype(font_file, 1000).getmetrics()[0]
+        
+        font_file_id = pdf.add_stream(font.data, " /Length1 {}".format(len(font.data)))
+        descriptor_id = pdf.add_object("<< /Type /FontDescriptor /FontName /LiberationSans /Flags 32 /FontBBox [{}] /ItalicAngle 0 /Ascent {} /Descent {} /CapHeight {} /StemV 80 /FontFile2 {} 0 R >>".format(" ".join([str(v) for v in font.bbox]), font.ascent, font.descent, font.ascent, font_file_id))
+        cid_font_id = pdf.add_object("<< /Type /Font /Subtype /CIDFontType2 /BaseFont /LiberationSans /CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> /FontDescriptor {} 0 R /CIDToGIDMap /Identity /W [0 [{}]] >>".format(descriptor_id, " ".join([str(w) for w in font.widths])))
+        to_unicode_id = pdf.add_stream(self.make_to_unicode())
+        self.font_id = pdf.add_object("<< /Type /Font /Subtype /Type0 /BaseFont /LiberationSans /Encoding /Identity-H /DescendantFonts [{} 0 R] /ToUnicode {} 0 R >>".format(cid_font_id, to_unicode_id))
+        self.resources = "<< /Font << /{} {} 0 R >> >>".format(name, self.font_id)
+    
+    def make_to_unicode(self):
+        # Maps the glyph IDs back to characters so text can be searched and copied
+        mappings = sorted(dict([(glyph_id, code) for code, glyph_id in self.glyph_ids.items()]).items())
+        lines = ["/CIDInit /ProcSet findresource begin", "12 dict begin", "begincmap", "/CMapName /Adobe-Identity-UCS def", "/CMapType 2 def", "1 begincodespacerange", "<0000> <FFFF>", "endcodespacerange"]
+        for start in range(0, len(mappings), 100):
+            chunk = mappings[start:start + 100]
+            lines.append("{} beginbfchar".format(len(chunk)))
+            lines.extend(["<{:04X}> <{:04X}>".format(glyph_id, code) for glyph_id, code in chunk])
+            lines.append("endbfchar")
+        lines.extend(["endcmap", "CMapName currentdict /CMap defineresource pop", "end", "end"])
+        return "\n".join(lines).encode('ascii')
+    
+    def encode(self, text):
+        # Hex string of glyph IDs, characters missing from the font use the .notdef glyph
+        return "<{}>".format("".join(["{:04X}".format(self.glyph_ids.get(ord(c), 0)) for c in text])).encode('ascii')
+
+
+def render_vector(layout, geometry, font):
+    # PDF content stream drawing the barcodes as filled rectangles and the texts with the embedded font.
+    # The layout is in pixels from the top left, PDF user space is in points from the bottom left.
+    scale = 72.0 / geometry.dpi
+    height = layout['height']
+    ops = [b"0 g"]
+    for barcode in layout['barcodes']:
+        x = barcode['x']
+        y = (height - barcode['y'] - barcode['height']) * scale
+        for i, width in enumerate(barcode['bars']):
+            # Bars and spaces alternate, starting with a bar
+            if i % 2 == 0:
+                ops.append("{:.3f} {:.3f} {:.3f} {:.3f} re".format(x * scale, y, width * scale, barcode['height'] * scale).encode('ascii'))
+            x += width
+    ops.append(b"f")
+    font_size = layout['font_size']
+    for x, y, text in layout['texts']:
+        # PDF positions texts by their baseline
+        baseline = height - y - font.ascent * font_size / 1000.0
+        ops.append("BT /{} {:.3f} Tf {:.3f} {:.3f} Td ".format(font.name, font_size * scale, x * scale, baseline * scale).encode('ascii') + font.encode(text) + b" Tj ET")
+    return b"\n".join(ops)
+
+
+def write_vector_pdf(filename, jobs, geometry):
+    # Vector output is cheap to produce, so it is written directly without a process pool
+    # and nothing is worth caching
+    pdf = PDFWriter(filename)
+    try:
+        font = PDFFont(pdf, geometry.font_file)
+        scale = 72.0 / geometry.dpi
+        for loc_name, parts in jobs:
+            layout = layout_label(loc_name, parts, geometry)
+            pdf.add_page(layout['width'] * scale, layout['height'] * scale, render_vector(layout, geometry, font), font.resources)
+    finally:
+        pdf.close()
+
+
+def open_output(target):
+    # Label printers usually accept jobs on a raw TCP port, "tcp://host[:port]" sends the output there
+    if target.startswith("tcp://"):
+        host, _, port = target[len("tcp://"):].partition(":")
+        sock = socket.create_connection((host, int(port or 9100)))
+        # The connection is closed together with the file
+        output = sock.makefile('wb')
+        sock.close()
+        return output
+    return open(target, 'wb')
+
+
+def zpl_field_data(text):
+    # Field data for use with ^FH, ^ and ~ would be taken as commands and _ is the escape character
+    data = text.encode('utf-8')
+    for char in b"_^~":
+        data = data.replace(bytes([char]), "_{:02X}".format(char).encode('ascii'))
+    return data
+
+
+def render_zpl(layout):
+    # Label as ZPL commands, the printer draws the texts with its built-in font and the barcodes itself.
+    # The layout is fitted with the metrics of the local TTF font, but ^A0 is the printer's own scalable
+    # font with different widths, so text positions and line breaks are only approximate. Use zpl-raster
+    # where the label has to match the PDF output.
+    # Printer-side Code128 may choose other code sets than code128_format, so barcode widths can differ slightly.
+    commands = [
+        b"^XA",
+        b"^CI28",
+        "^PW{}".format(layout['width']).encode('ascii'),
+        "^LL{}".format(layout['height']).encode('ascii'),
+        b"^LH0,0"
+    ]
+    for barcode in layout['barcodes']:
+        commands.append("^FO{},{}^BY{}^BCN,{},N,N,N,A^FH^FD".format(barcode['x'], barcode['y'], barcode['thickness'], barcode['height']).encode('ascii') + zpl_field_data(barcode['data']) + b"^FS")
+    for x, y, text in layout['texts']:
+        commands.append("^FO{},{}^A0N,{}^FH^FD".format(round(x), round(y), layout['font_size']).encode('ascii') + zpl_field_data(text) + b"^FS")
+    commands.append(b"^XZ")
+    return b"\n".join(commands) + b"\n"
+
+
+def write_zpl(filename, jobs, geometry):
+    # Nothing is rendered locally, so no process pool or cache is needed
+    with open_output(filename) as output:
+        for loc_name, parts in jobs:
+            output.write(render_zpl(layout_label(loc_name, parts, geometry)))
+
+
+def zpl_compress_row(row, previous):
+    # ZPL compressed ASCII for one row of hex digits: ':' repeats the previous row, ',' fills the
+    # rest of the row with zeros and a run of one digit is prefixed by its length, coded as
+    # G-Y for 1-19 plus g-z for multiples of 20 up to 400
+    if row == previous:
+        return ":"
+    stripped = row.rstrip("0")
+    encoded = []
+    for match in re.finditer(r"(.)\1*", stripped):
+        count = len(match.group(0))
+        while count > 0:
+            run = min(count, 419)
+            if run > 1:
+                if run >= 20:
+                    encoded.append(chr(ord('g') + run // 20 - 1))
+                if run % 20:
+                    encoded.append(chr(ord('G') + run % 20 - 1))
+            encoded.append(match.group(1))
+            count -= run
+    if len(stripped) < len(row):
+        encoded.append(",")
+    return "".join(encoded)
+
+
+def render_zpl_raster_page(job, geometry):
+    # Runs in a worker process: the label rendered locally and sent as 1-bit ZPL graphic field
+    # (set bits are black, rows padded to whole bytes), no dithering so barcodes stay sharp
+    loc_name, parts = job
+    img = render_raster(layout_label(loc_name, parts, geometry), geometry)
+    bitmap = img.point(lambda v: 255 if v < 128 else 0).convert("1", dither=Image.Dither.NONE)
+    data = bitmap.tobytes()
+    bytes_per_row = (img.size[0] + 7) // 8
+    rows = []
+    previous = None
+    for offset in range(0, len(data), bytes_per_row):
+        row = data[offset:offset + bytes_per_row].hex().upper()
+        rows.append(zpl_compress_row(row, previous))
+        previous = row
+    zpl = "^XA\n^PW{}\n^LL{}\n^LH0,0\n^FO0,0^GFA,{},{},{},{}^FS\n^XZ\n".format(img.size[0], img.size[1], len(data), len(data), bytes_per_row, "".join(rows))
+    return (zpl.encode('ascii'), render_cache.take_new_entries())
+
+
+def write_zpl_raster(filename, jobs, geometry, workers=None, cache_file=None):
+    with open_output(filename) as output:
+        for data, in iter_rendered_cached(render_zpl_raster_page, jobs, geometry, workers, cache_file):
+            output.write(data)
+
+
+# Output formats of generate-labels
+LABEL_FORMATS = {
+    'pdf-raster': write_raster_pdf,
+    'pdf-vector': write_vector_pdf,
+    'zpl': write_zpl,
+    'zpl-raster': write_zpl_raster
+}
+
+# Formats rendered locally, only these take the workers and cache_file arguments
+RENDERED_LABEL_FORMATS = ('pdf-raster', 'zpl-raster')
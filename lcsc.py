@@ -1,15 +1,33 @@
-import requests
+from transport import InstrumentedSession
 
 
 class LCSC:
-    def __init__(self):
-        self.base_url = "https://wmsc.lcsc.com"
+    # Can be pointed at a stand-in server, e.g. by the benchmark
+    BASE_URL = "https://wmsc.lcsc.com"
+    
+    def __init__(self, rate_limiter=None, cache=None, pool_size=8, timeout=30):
+        self.base_url = self.BASE_URL
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        self.session = InstrumentedSession(pool_size=pool_size, timeout=timeout)
     
     def get_part_details(self, order_no):
+        if self.cache:
+            data = self.cache.get("LCSC", 'part', order_no.upper())
+            if data is not None:
+                return data
+        data = self.request_part_details(order_no)
+        if self.cache and data is not None and data['code'] == 200 and data['result']:
+            self.cache.put("LCSC", 'part', order_no.upper(), data)
+        return data
+    
+    def request_part_details(self, order_no):
         full_url = self.base_url + "/wmsc/product/detail"
         url_params = {'productCode': order_no}
         cookies = {'currencyCode': "EUR"}
-        resp = requests.get(full_url, params=url_params, cookies=cookies)
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+        resp = self.session.get(full_url, params=url_params, cookies=cookies)
         if resp.status_code != 200:
             return None
         return resp.json()
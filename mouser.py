@@ -1,12 +1,46 @@
-import requests
+from transport import InstrumentedSession
 
 
 class Mouser:
-    def __init__(self, api_key):
-        self.base_url = "https://api.mouser.com"
+    # Can be pointed at a stand-in server, e.g. by the benchmark
+    BASE_URL = "https://api.mouser.com"
+    
+    # Maximum number of pipe-separated part numbers per search request
+    MAX_PART_NUMBERS = 10
+    
+    def __init__(self, api_key, rate_limiter=None, cache=None, pool_size=8, timeout=30):
+        self.base_url = self.BASE_URL
         self.api_key = api_key
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        self.session = InstrumentedSession(pool_size=pool_size, timeout=timeout, retry_all_methods=True)
+    
+    @staticmethod
+    def get_cache_key(part_number):
+        # Parts are cached under their Mouser part number by single and batch lookups alike
+        return part_number.upper()
+    
+    def cache_exact_matches(self, parts, order_nos):
+        # The search also returns similar parts, only the ones that were asked for are cached
+        keys = set([self.get_cache_key(order_no) for order_no in order_nos])
+        for part in parts:
+            key = self.get_cache_key(part['MouserPartNumber'])
+            if key in keys:
+                self.cache.put("Mouser", 'part', key, part)
     
     def get_part_details(self, order_no):
+        # Search results include prices, so they are cached with the short 'part' lifetime
+        if self.cache:
+            part = self.cache.get("Mouser", 'part', self.get_cache_key(order_no))
+            if part is not None:
+                return {'Errors': [], 'SearchResults': {'NumberOfResult': 1, 'Parts': [part]}}
+        data = self.search_part_numbers(order_no)
+        if self.cache and data is not None and not data['Errors']:
+            self.cache_exact_matches(data['SearchResults']['Parts'], [order_no])
+        return data
+    
+    def search_part_numbers(self, order_no):
+        # order_no may contain several pipe-separated part numbers
         full_url = self.base_url + "/api/v2/search/partnumber"
         url_params = {'apiKey': self.api_key}
         json = {
@@ -15,7 +49,30 @@ class Mouser:
                 'partSearchOptions': None
             }
         }
-        resp = requests.post(full_url, params=url_params, json=json)
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+        resp = self.session.post(full_url, params=url_params, json=json)
         if resp.status_code != 200:
             return None
         return resp.json()
+    
+    def get_parts_details(self, order_nos):
+        # Returns the found parts keyed by Mouser part number, or None on API errors
+        results = {}
+        missing = []
+        for order_no in order_nos:
+            part = self.cache.get("Mouser", 'part', self.get_cache_key(order_no)) if self.cache else None
+            if part is None:
+                missing.append(order_no)
+            else:
+                results[part['MouserPartNumber']] = part
+        for start in range(0, len(missing), self.MAX_PART_NUMBERS):
+            chunk = missing[start:start + self.MAX_PART_NUMBERS]
+            data = self.search_part_numbers("|".join(chunk))
+            if data is None or data['Errors']:
+                return None
+            if self.cache:
+                self.cache_exact_matches(data['SearchResults']['Parts'], chunk)
+            for part in data['SearchResults']['Parts']:
+                results[part['MouserPartNumber']] = part
+        return results
@@ -0,0 +1,106 @@
+import threading
+
+
+class PartIndex:
+    # In-memory lookup tables over a list of parts, kept up to date when parts are created or changed.
+    # Lookups that can match several parts return them in insertion order,
+    # the find_* shortcuts return the last one like the old ad-hoc dicts did.
+    def __init__(self, parts=()):
+        self.lock = threading.RLock()
+        self.parts_by_id = {}
+        # Keys are remembered per part since parts may be modified in place before they are re-indexed
+        self.keys_by_id = {}
+        self.part_ids_by_name = {}
+        self.part_ids_by_order_no = {}
+        self.part_ids_by_mpn = {}
+        self.part_ids_by_location = {}
+        self.part_ids_by_category = {}
+        for part in parts:
+            self.add_part(part)
+    
+    def __len__(self):
+        return len(self.parts_by_id)
+    
+    def __iter__(self):
+        return iter(self.parts_by_id.values())
+    
+    def get_keys(self, part):
+        keys = []
+        keys.append((self.part_ids_by_name, part['name'].lower()))
+        for distributor in part.get('distributors') or []:
+            if distributor.get('orderNumber'):
+                keys.append((self.part_ids_by_order_no, distributor['orderNumber']))
+        for mf in part.get('manufacturers') or []:
+            if mf.get('partNumber'):
+                keys.append((self.part_ids_by_mpn, mf['partNumber'].lower()))
+        if part.get('storageLocation') and 'name' in part['storageLocation']:
+            keys.append((self.part_ids_by_location, part['storageLocation']['name']))
+        if part.get('category') and 'name' in part['category']:
+            keys.append((self.part_ids_by_category, part['category']['name']))
+        return keys
+    
+    def add_part(self, part):
+        with self.lock:
+            if part['@id'] in self.parts_by_id:
+                self.remove_part(part['@id'])
+            self.parts_by_id[part['@id']] = part
+            self.keys_by_id[part['@id']] = self.get_keys(part)
+            for index, key in self.keys_by_id[part['@id']]:
+                # dicts double as ordered sets of part IDs
+                index.setdefault(key, {})[part['@id']] = None
+    
+    def remove_part(self, part_id):
+        with self.lock:
+            part = self.parts_by_id.pop(part_id, None)
+            if part is None:
+                return
+            for index, key in self.keys_by_id.pop(part_id):
+                part_ids = index.get(key)
+                if part_ids is None:
+                    continue
+                part_ids.pop(part_id, None)
+                if not part_ids:
+                    del index[key]
+    
+    def update(self, entity):
+        # Accepts any API result, only parts are indexed
+        if entity['@id'].startswith("/api/parts/"):
+            self.add_part(entity)
+    
+    def get_parts(self, index, key):
+        with self.lock:
+            return [self.parts_by_id[part_id] for part_id in index.get(key, ())]
+    
+    def get_last(self, index, key):
+        parts = self.get_parts(index, key)
+        return parts[-1] if parts else None
+    
+    def get_part(self, part_id):
+        return self.parts_by_id.get(part_id)
+    
+    def find_by_name(self, name):
+        return self.get_last(self.part_ids_by_name, name.lower())
+    
+    def find_by_order_no(self, order_no):
+        return self.get_last(self.part_ids_by_order_no, order_no)
+    
+    def get_parts_by_order_no(self, order_no):
+        return self.get_parts(self.part_ids_by_order_no, order_no)
+    
+    def get_parts_by_mpn(self, mpn):
+        return self.get_parts(self.part_ids_by_mpn, mpn.lower())
+    
+    def get_parts_by_location(self, location_name):
+        return self.get_parts(self.part_ids_by_location, location_name)
+    
+    def get_parts_by_category(self, category_name):
+        return self.get_parts(self.part_ids_by_category, category_name)
+    
+    def get_locations(self):
+        return sorted(self.part_ids_by_location.keys())
+    
+    def get_part_distributor(self, part, order_no):
+        for distributor in part.get('distributors') or []:
+            if distributor['orderNumber'] == order_no:
+                return distributor
+        return None
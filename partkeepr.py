@@ -1,62 +1,207 @@
+import hashlib
 import io
 import json
 import os
-import requests
+import threading
+import time
+import urllib.parse
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from part_index import PartIndex
+from photos import Photo
+from reference_data import ReferenceData
+from records import Interner, Part, Record, to_json
+from transport import InstrumentedSession
+from write_queue import WriteQueue
 
 
 class PartKeepr:
-    def __init__(self, base_url, username, password):
+    def __init__(self, base_url, username, password, page_workers=4, catalog=None, compact=False, pool_size=16, retries=3, reference_ttl=3600, write_workers=8, partial_updates=False):
         # base_url is something like https://my.partkeepr.host (no trailing slash)
         self.base_url = base_url
-        self.session = requests.Session()
+        # Number of collection pages that are fetched concurrently
+        self.page_workers = page_workers
+        # Optional local Catalog that read-mostly actions can be served from
+        self.catalog = catalog
+        # With compact set, parts are returned as slotted Part records sharing repeated strings and references
+        self.compact = compact
+        self.interner = Interner()
+        # Optional PartIndex shared by the tools, kept up to date on writes
+        self.part_index = None
+        # Shared name -> @id lookups for manufacturers, distributors, categories and storage locations
+        self.reference_data = ReferenceData(self, ttl=reference_ttl)
+        # Opt-in: PUT only the changed fields. The first partial update checks that the server keeps
+        # the omitted fields (see update_fields), it is cleared if the server resets them.
+        self.partial_updates = partial_updates
+        self.partial_updates_verified = False
+        self.partial_updates_lock = threading.Lock()
+        # Bulk writes queued by the tools, ordered per resource
+        self.writes = WriteQueue(workers=write_workers)
+        # Serializes manufacturer lookup/creation when parts are updated from several threads
+        self.manufacturer_lock = threading.Lock()
+        # Number of writes update_part_data skipped because nothing changed
+        self.avoided_writes = 0
+        self.avoided_writes_lock = threading.Lock()
+        self.session = InstrumentedSession(pool_size=pool_size, retries=retries)
         self.session.auth = (username, password)
+        # Stock changes are not idempotent, a retried timeout could apply them twice
+        self.action_session = InstrumentedSession(pool_size=2, retries=retries, stats=self.session.stats, connect_retries_only=True)
+        self.action_session.auth = self.session.auth
+        self.action_session.cookies = self.session.cookies
         self.user = self.login()
     
     def login(self):
         return self.session.post(self.base_url + "/api/users/login").json()
     
+    def cache_result(self, result):
+        # Write-through so the local catalog and part index reflect changes made by the tools
+        if isinstance(result, dict) and '@id' in result:
+            if self.catalog is not None:
+                self.catalog.put(result)
+            if self.part_index is not None:
+                self.part_index.update(result)
+            self.reference_data.update(result)
+        return result
+    
     def get(self, url, params=None):
         return self.session.get(self.base_url + url, params=params).json()
     
     def create(self, url, data, params=None):
-        return self.session.post(self.base_url + url, json=data, params=params).json()
+        return self.cache_result(self.session.post(self.base_url + url, json=to_json(data), params=params).json())
     
     def update(self, url, data, params=None):
-        return self.session.put(self.base_url + url, json=data, params=params).json()
+        return self.cache_result(self.session.put(self.base_url + url, json=to_json(data), params=params).json())
+    
+    def update_once(self, url, data):
+        # PUT for non-idempotent actions, only retried if the request never reached the server
+        return self.cache_result(self.action_session.put(self.base_url + url, json=to_json(data)).json())
     
     def delete(self, url, params=None):
         self.session.delete(self.base_url + url, params=params)
+        if self.catalog is not None and self.catalog.is_tracked(url):
+            self.catalog.remove(url)
+        self.reference_data.remove(url)
     
     def upload(self, url, file, params=None):
         return self.session.post(self.base_url + url, files=file, params=params).json()
     
+    def get_page_count(self, data):
+        # The first page of a hydra collection links to the last one, e.g. /api/parts?page=42
+        last_page = data.get('hydra:lastPage')
+        if not last_page:
+            return None
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(last_page).query)
+        if 'page' not in query:
+            return None
+        return int(query['page'][0])
+    
+    def iter_paged(self, url, params=None):
+        # Yields collection members in server order while the remaining pages
+        # are prefetched by a bounded pool of workers
+        data = self.get(url, params=params)
+        yield from data['hydra:member']
+        if not data.get('hydra:nextPage'):
+            return
+        
+        num_pages = self.get_page_count(data)
+        if num_pages is None:
+            # No page count available, walk the pages one by one
+            next_page = data['hydra:nextPage']
+            while next_page:
+                data = self.get(next_page, params=params)
+                yield from data['hydra:member']
+                next_page = data.get('hydra:nextPage')
+            return
+        
+        path = urllib.parse.urlsplit(data['hydra:nextPage']).path
+        workers = max(1, self.page_workers)
+        pending = deque()
+        next_page = 2
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            while next_page <= num_pages or pending:
+                # Keep at most two pages per worker in flight to bound memory use
+                while next_page <= num_pages and len(pending) < 2 * workers:
+                    page_params = dict(params or {})
+                    page_params['page'] = next_page
+                    pending.append(executor.submit(self.get, path, page_params))
+                    next_page += 1
+                data = pending.popleft().result()
+                yield from data['hydra:member']
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+    
     def get_paged(self, url, params=None):
-        result = []
-        next_page = url
-        while next_page:
-            data = self.get(next_page, params=params)
-            result.extend(data['hydra:member'])
-            next_page = data.get('hydra:nextPage')
-        return result
+        return list(self.iter_paged(url, params=params))
     
-    def get_parts(self, filter=None):
+    def get_parts_params(self, filter=None):
         if filter:
-            params = {'filter': json.dumps([filter])}
-        else:
-            params = None
-        return self.get_paged("/api/parts", params=params)
+            return {'filter': json.dumps([filter])}
+        return None
+    
+    def iter_cached_paged(self, collection, params=None):
+        if params is None and self.catalog is not None and self.catalog.is_synced(collection):
+            return iter(self.catalog.get_all(collection))
+        return self.iter_paged("/api/" + collection, params=params)
+    
+    def get_cached_paged(self, collection, params=None):
+        return list(self.iter_cached_paged(collection, params=params))
+    
+    def iter_parts(self, filter=None):
+        parts = self.iter_cached_paged("parts", params=self.get_parts_params(filter))
+        if self.compact:
+            return (Part.from_json(part, self.interner) for part in parts)
+        return parts
+    
+    def get_parts(self, filter=None):
+        return list(self.iter_parts(filter))
+    
+    def get_part_index(self, parts=None):
+        # Builds the shared PartIndex in one pass over all parts (or the given ones)
+        if parts is None:
+            parts = self.iter_parts()
+        self.part_index = PartIndex(parts)
+        return self.part_index
     
     def get_part(self, part_id):
-        return self.get("/api/parts/{}".format(part_id))
+        return self.cache_result(self.get("/api/parts/{}".format(part_id)))
     
     def get_manufacturers(self):
-        return self.get_paged("/api/manufacturers")
+        return self.get_cached_paged("manufacturers")
     
     def get_distributors(self):
-        return self.get_paged("/api/distributors")
+        return self.get_cached_paged("distributors")
+    
+    def get_part_categories(self):
+        return self.get_cached_paged("part_categories")
     
     def get_storage_locations(self):
-        return self.get_paged("/api/storage_locations")
+        return self.get_cached_paged("storage_locations")
+    
+    def sync_catalog(self, full=False, max_age=None):
+        # Collections are only paged from the server on the first run, with full=True or once they
+        # are older than max_age seconds; otherwise the tools read the local copy, which is kept
+        # current by the writes made through this client.
+        if self.catalog is None:
+            return
+        
+        for collection in self.catalog.COLLECTIONS:
+            synced_at = time.time()
+            last_sync = self.catalog.get_last_sync(collection)
+            if full or last_sync is None:
+                print("Syncing {}".format(collection))
+                self.catalog.replace_collection(collection, self.iter_paged("/api/" + collection), synced_at)
+            elif max_age is not None and synced_at - last_sync > max_age:
+                # PartKeepr has no modification timestamps, so stock, names, locations etc. can only
+                # be refreshed by reading the collections again. Only the entities that changed are
+                # rewritten and the ones deleted on the server are dropped.
+                changed, removed = self.catalog.update_collection(collection, self.iter_paged("/api/" + collection), synced_at)
+                print("Syncing {}: {} changed, {} removed".format(collection, changed, removed))
+            else:
+                continue
+            self.reference_data.invalidate(collection)
     
     def get_project(self, project_id):
         return self.get("/api/projects/{}".format(project_id))
@@ -79,18 +224,83 @@ class PartKeepr:
     def create_project_part(self, project_part):
         return self.create("/api/project_parts", project_part)
     
-    def update_part(self, part):
-        return self.update(part['@id'], part)
+    def update_fields(self, entity, fields=None):
+        # PUT only the given fields (or the ones changed on a record) if partial updates are
+        # enabled, the whole entity otherwise or if the changed fields are unknown. Errors are
+        # returned as they are, retrying with the full entity would fail the same way or
+        # overwrite fields changed on the server in the meantime.
+        if fields is None and isinstance(entity, Record):
+            fields = entity.get_changed_fields()
+        if fields and self.partial_updates:
+            if self.partial_updates_verified:
+                result = self.update_partial(entity, fields, verify=False)
+            else:
+                # Until a partial update showed that the server keeps omitted fields, only one
+                # runs at a time, so at most one entity has to be restored if it does not
+                with self.partial_updates_lock:
+                    result = self.update_partial(entity, fields, verify=not self.partial_updates_verified) if self.partial_updates else None
+            if result is not None:
+                return result
+        result = self.update(entity['@id'], entity)
+        if isinstance(entity, Record) and isinstance(result, dict) and '@id' in result:
+            entity.clear_changed_fields()
+        return result
+    
+    def update_partial(self, entity, fields, verify):
+        # Returns None if the server turned out to reset the omitted fields
+        data = dict([(field, entity[field]) for field in fields])
+        result = self.update(entity['@id'], data)
+        if not isinstance(result, dict) or '@id' not in result:
+            return result
+        if verify:
+            kept = self.kept_omitted_fields(entity, fields, result)
+            if kept is False:
+                # Restored by the caller with a full update, full updates are sent from now on
+                print("        Server does not support partial updates, sending full entities")
+                self.partial_updates = False
+                return None
+            if kept:
+                self.partial_updates_verified = True
+        if isinstance(entity, Record):
+            entity.clear_changed_fields()
+        return result
+    
+    def kept_omitted_fields(self, entity, fields, result):
+        # Whether the fields that were not sent are still set after the update,
+        # None if none of them was set before
+        data = entity.to_json() if isinstance(entity, Record) else entity
+        kept = None
+        for key, value in data.items():
+            if key in fields or key.startswith("@") or not value or key not in result:
+                continue
+            if result[key] in (None, "", [], {}):
+                return False
+            kept = True
+        return kept
     
-    def update_part_manufacturer(self, part_manufacturer):
-        return self.update(part_manufacturer['@id'], part_manufacturer)
+    def update_part(self, part, fields=None):
+        return self.update_fields(part, fields)
     
-    def update_part_distributor(self, part_distributor):
-        return self.update(part_distributor['@id'], part_distributor)
+    def update_part_manufacturer(self, part_manufacturer, fields=None):
+        return self.update_fields(part_manufacturer, fields)
+    
+    def update_part_distributor(self, part_distributor, fields=None):
+        return self.update_fields(part_distributor, fields)
     
     def update_project(self, project):
         return self.update(project['@id'], project)
     
+    def queue_write(self, key, func, *args, description=None, **kwargs):
+        # Runs e.g. queue_write(part['@id'], pk.update_part, part) in the background, see WriteQueue
+        return self.writes.submit(key, func, *args, description=description, **kwargs)
+    
+    def wait_for_writes(self):
+        # Returns the (description, error) of every queued write that failed
+        return self.writes.join()
+    
+    def close(self):
+        self.writes.close()
+    
     def upload_temp_file(self, file):
         return self.upload("/api/temp_uploaded_files/upload", {'userfile': file})
     
@@ -98,29 +308,75 @@ class PartKeepr:
         return self.create("/api/temp_uploaded_files/upload", {'url': url})
     
     def part_add_stock(self, part_id, quantity):
-        return self.update(part_id + "/addStock", {'quantity': quantity})
+        return self.update_once(part_id + "/addStock", {'quantity': quantity})
     
     def part_remove_stock(self, part_id, quantity):
-        return self.update(part_id + "/removeStock", {'quantity': quantity})
+        return self.update_once(part_id + "/removeStock", {'quantity': quantity})
     
     def part_set_stock(self, part_id, quantity):
-        return self.update(part_id + "/setStock", {'quantity': quantity})
+        return self.update_once(part_id + "/setStock", {'quantity': quantity})
     
-    def update_part_data(self, part, part_data, distributor, manufacturer_ids_by_name=None):
+    def count_avoided_writes(self, count=1):
+        with self.avoided_writes_lock:
+            self.avoided_writes += count
+    
+    def format_price(self, price):
+        return "{:.5f}".format(float(price))
+    
+    def make_fingerprint(self, description, manufacturers, has_photo, parameters):
+        data = {
+            'description': (description or "").strip(),
+            'manufacturers': sorted(manufacturers.items()),
+            'photo': has_photo,
+            'parameters': sorted(parameters.items())
+        }
+        return hashlib.sha1(json.dumps(data).encode('utf-8')).hexdigest()
+    
+    def get_part_fingerprint(self, part):
+        # Fingerprint of the fields managed by update_part_data as currently stored
+        manufacturers = dict([(mf.get('manufacturer', {}).get('name', "").lower(), mf.get('partNumber') or "") for mf in part['manufacturers']])
+        parameters = dict([(p['name'], p.get('stringValue') or "") for p in part['parameters']])
+        return self.make_fingerprint(part['description'], manufacturers, bool(part['attachments']), parameters)
+    
+    def get_part_data_fingerprint(self, part, part_data):
+        # Fingerprint of the same fields after update_part_data would have applied part_data
+        manufacturers = dict([(mf.get('manufacturer', {}).get('name', "").lower(), mf.get('partNumber') or "") for mf in part['manufacturers']])
+        if part_data['manufacturer']:
+            manufacturers[part_data['manufacturer'].lower()] = part_data['manufacturer_part_no'] or ""
+        parameters = dict([(p['name'], p.get('stringValue') or "") for p in part['parameters']])
+        if part_data['parameters']:
+            parameters.update([(name, value or "") for name, value in part_data['parameters'].items()])
+        description = part_data['description'] or part['description']
+        has_photo = bool(part['attachments']) or bool(part_data['photo'])
+        return self.make_fingerprint(description, manufacturers, has_photo, parameters)
+    
+    def discard_photo(self, part_data):
+        if isinstance(part_data['photo'], io.IOBase):
+            part_data['photo'].close()
+            os.remove(part_data['photo'].name)
+    
+    def compare_part_data(self, part, part_data, distributor):
+        # Returns whether the part fields and the distributor price would stay the same,
+        # a distributor without a stored price always gets the new one
+        part_unchanged = self.get_part_fingerprint(part) == self.get_part_data_fingerprint(part, part_data)
+        stored_price = distributor.get('price')
+        price_unchanged = not part_data['prices'] or (stored_price not in (None, "") and self.format_price(stored_price) == self.format_price(part_data['prices'][0]['price']))
+        return part_unchanged, price_unchanged
+    
+    def get_manufacturer_ids_by_name(self, manufacturer_ids_by_name=None):
         if not manufacturer_ids_by_name:
-            print("Getting manufacturers")
-            manufacturers = self.get_manufacturers()
-            manufacturer_ids_by_name = dict([(mf['name'].lower(), mf['@id']) for mf in manufacturers])
-        
-        part_manufacturers = part['manufacturers']
-        part_manufacturer_ids_by_name = dict([(mf['manufacturer']['name'].lower(), mf['@id']) for mf in part_manufacturers]) 
-        
-        # Update description
+            manufacturer_ids_by_name = self.reference_data.get_ids_by_name("manufacturers")
+        return manufacturer_ids_by_name
+    
+    def update_part_description(self, part, part_data):
         if part_data['description']:
             print("        Updating description")
             part['description'] = part_data['description']
+    
+    def update_part_manufacturer_data(self, part, part_data, manufacturer_ids_by_name):
+        part_manufacturers = part['manufacturers']
+        part_manufacturer_ids_by_name = dict([(mf['manufacturer']['name'].lower(), mf['@id']) for mf in part_manufacturers]) 
         
-        # Update manufacturer data if available
         if part_data['manufacturer']:
             print("        Manufacturer: {}".format(part_data['manufacturer']))
             if part_data['manufacturer'].lower() in part_manufacturer_ids_by_name:
@@ -128,19 +384,23 @@ class PartKeepr:
                 part_mf_id = part_manufacturer_ids_by_name[part_data['manufacturer'].lower()]
                 for mf in part_manufacturers:
                     if mf['@id'] == part_mf_id:
+                        if mf['partNumber'] == part_data['manufacturer_part_no']:
+                            self.count_avoided_writes()
+                            continue
                         print("        Updating part manufacturer entry")
                         mf['partNumber'] = part_data['manufacturer_part_no']
-                        result = self.update_part_manufacturer(mf)
+                        result = self.update_part_manufacturer(mf, ['partNumber'])
             else:
-                if part_data['manufacturer'].lower() in manufacturer_ids_by_name:
-                    print("        Found manufacturer in database")
-                    mf_id = manufacturer_ids_by_name[part_data['manufacturer'].lower()]
-                else:
-                    print("        Creating manufacturer entry")
-                    mf_new = {'name': part_data['manufacturer']}
-                    result = self.create_manufacturer(mf_new)
-                    mf_id = result['@id']
-                    manufacturer_ids_by_name[part_data['manufacturer'].lower()] = mf_id
+                with self.manufacturer_lock:
+                    if part_data['manufacturer'].lower() in manufacturer_ids_by_name:
+                        print("        Found manufacturer in database")
+                        mf_id = manufacturer_ids_by_name[part_data['manufacturer'].lower()]
+                    else:
+                        print("        Creating manufacturer entry")
+                        mf_new = {'name': part_data['manufacturer']}
+                        result = self.create_manufacturer(mf_new)
+                        mf_id = result['@id']
+                        manufacturer_ids_by_name[part_data['manufacturer'].lower()] = mf_id
                 print("        Creating part manufacturer entry")
                 part_mf_new = {'manufacturer': {'@id': mf_id}, 'partNumber': part_data['manufacturer_part_no']}
                 result = self.create_part_manufacturer(part_mf_new)
@@ -149,27 +409,35 @@ class PartKeepr:
                 part['manufacturers'].append({'@id': part_mf_id})
         else:
             print("        No manufacturer found!")
-        
-        # Update pricing data
-        if part_data['prices']:
+    
+    def update_part_price(self, distributor, part_data, price_unchanged):
+        if part_data['prices'] and price_unchanged:
+            self.count_avoided_writes()
+        elif part_data['prices']:
             new_price = part_data['prices'][0]['price'] # Always use lowest quantity group
             print("        Updating price from {} to {:.5f}".format(distributor['price'], new_price))
             distributor['price'] = new_price
-            result = self.update_part_distributor(distributor)
-        
+            result = self.update_part_distributor(distributor, ['price'])
+    
+    def update_part_photo(self, part, part_data):
         # Update image if no image attachment is present and distributor has a photo
         if not [a['isImage'] for a in part['attachments']] and part_data['photo']:
             print("        Updating photo")
-            if isinstance(part_data['photo'], io.IOBase):
+            if isinstance(part_data['photo'], Photo):
+                file_id = part_data['photo'].upload(self)
+                if file_id is None:
+                    return
+            elif isinstance(part_data['photo'], io.IOBase):
                 result = self.upload_temp_file(part_data['photo'])
                 part_data['photo'].close()
                 os.remove(part_data['photo'].name)
+                file_id = result['image']['@id']
             else:
                 result = self.upload_temp_file_from_url(part_data['photo'])
-            file_id = result['image']['@id']
+                file_id = result['image']['@id']
             part['attachments'].append({'@id': file_id})
-        
-        # Update parameters
+    
+    def update_part_parameters(self, part, part_data):
         # For now, all parameters are treated as text and the PartKeepr Unit system is not used.
         if part_data['parameters']:
             print("        Updating parameters")
@@ -182,6 +450,27 @@ class PartKeepr:
                         break
                 if not param_found:
                     part['parameters'].append({'name': param_name, 'stringValue': param_value})
+    
+    # Part fields written by update_part_data, the rest of the part is left alone
+    PART_DATA_FIELDS = ('description', 'manufacturers', 'attachments', 'parameters')
+    
+    def update_part_data(self, part, part_data, distributor, manufacturer_ids_by_name=None):
+        part_unchanged, price_unchanged = self.compare_part_data(part, part_data, distributor)
+        if part_unchanged and price_unchanged:
+            print("        Part data unchanged, skipping")
+            self.discard_photo(part_data)
+            self.count_avoided_writes(2 if part_data['prices'] else 1)
+            return part
+        
+        manufacturer_ids_by_name = self.get_manufacturer_ids_by_name(manufacturer_ids_by_name)
+        self.update_part_description(part, part_data)
+        self.update_part_manufacturer_data(part, part_data, manufacturer_ids_by_name)
+        self.update_part_price(distributor, part_data, price_unchanged)
+        self.update_part_photo(part, part_data)
+        self.update_part_parameters(part, part_data)
         
         # Update part in database
-        return self.update_part(part)
+        if part_unchanged:
+            self.count_avoided_writes()
+            return part
+        return self.update_part(part, self.PART_DATA_FIELDS)
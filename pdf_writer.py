@@ -0,0 +1,67 @@
+import zlib
+
+
+class PDFWriter:
+    # Minimal PDF writer that streams objects to the file as they are added. Only the object
+    # offsets and page IDs are kept in memory, so documents with thousands of pages can be
+    # written page by page. Object 1 is the catalog and object 2 the page tree, both are
+    # written by close() once all pages are known.
+    def __init__(self, filename):
+        self.file = open(filename, 'wb')
+        self.offsets = {}
+        self.next_id = 3
+        self.page_ids = []
+        self.file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    
+    def reserve(self):
+        obj_id = self.next_id
+        self.next_id += 1
+        return obj_id
+    
+    def write_object(self, obj_id, body):
+        self.offsets[obj_id] = self.file.tell()
+        self.file.write("{} 0 obj\n".format(obj_id).encode('ascii'))
+        self.file.write(body)
+        self.file.write(b"\nendobj\n")
+        return obj_id
+    
+    def add_object(self, body):
+        return self.write_object(self.reserve(), body.encode('latin-1') if isinstance(body, str) else body)
+    
+    def add_stream(self, data, dictionary="", compress=True):
+        if compress:
+            data = zlib.compress(data)
+            dictionary += " /Filter /FlateDecode"
+        header = "<< /Length {}{} >>\nstream\n".format(len(data), dictionary).encode('latin-1')
+        return self.add_object(header + data + b"\nendstream")
+    
+    def add_page(self, width, height, content, resources):
+        # width and height in points, content is the page content stream,
+        # resources the page resource dictionary, e.g. "<< /XObject << /Im1 5 0 R >> >>"
+        content_id = self.add_stream(content)
+        page_id = self.add_object("<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {:.3f} {:.3f}] /Resources {} /Contents {} 0 R >>".format(width, height, resources, content_id))
+        self.page_ids.append(page_id)
+        return page_id
+    
+    def close(self):
+        kids = " ".join(["{} 0 R".format(page_id) for page_id in self.page_ids])
+        self.write_object(2, "<< /Type /Pages /Kids [{}] /Count {} >>".format(kids, len(self.page_ids)).encode('latin-1'))
+        self.write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        xref_offset = self.file.tell()
+        self.file.write("xref\n0 {}\n".format(self.next_id).encode('ascii'))
+        self.file.write(b"0000000000 65535 f \n")
+        for obj_id in range(1, self.next_id):
+            self.file.write("{:010d} 00000 n \n".format(self.offsets[obj_id]).encode('ascii'))
+        self.file.write("trailer\n<< /Size {} /Root 1 0 R >>\nstartxref\n{}\n%%EOF\n".format(self.next_id, xref_offset).encode('ascii'))
+        self.file.close()
+    
+    def add_raster_page(self, width_px, height_px, dpi, data, compressed=False):
+        # One 8-bit grayscale image covering the whole page
+        if not compressed:
+            data = zlib.compress(data, 3)
+        header = "<< /Type /XObject /Subtype /Image /Width {} /Height {} /ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode /Length {} >>\nstream\n".format(width_px, height_px, len(data))
+        image_id = self.add_object(header.encode('latin-1') + data + b"\nendstream")
+        width = width_px * 72.0 / dpi
+        height = height_px * 72.0 / dpi
+        content = "q {:.3f} 0 0 {:.3f} 0 0 cm /Im1 Do Q".format(width, height).encode('ascii')
+        return self.add_page(width, height, content, "<< /XObject << /Im1 {} 0 R >> >>".format(image_id))
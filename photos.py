@@ -0,0 +1,90 @@
+import atexit
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Photo:
+    # Handle for a photo that is being downloaded in the background
+    def __init__(self, pipeline, url, future):
+        self.pipeline = pipeline
+        self.url = url
+        self.future = future
+    
+    def result(self):
+        # (file name, sha256 digest) of the downloaded photo, or None if the download failed
+        return self.future.result()
+    
+    def upload(self, pk):
+        return self.pipeline.upload(pk, self)
+
+
+class PhotoPipeline:
+    # Streams product photos to a temporary directory while hashing them. Photos with the same
+    # URL are only downloaded once and photos with the same content are only stored once.
+    # Each part still gets its own PartKeepr temp upload, since attaching a temp upload to a
+    # part moves it into the part's attachments.
+    def __init__(self, session, temp_dir=None, workers=4, chunk_size=65536):
+        self.session = session
+        self.temp_dir = temp_dir or tempfile.mkdtemp(prefix="partkeepr-photos-")
+        self.chunk_size = chunk_size
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        self.photos_by_url = {}
+        self.files_by_digest = {}
+        atexit.register(self.cleanup)
+    
+    def fetch(self, url):
+        with self.lock:
+            photo = self.photos_by_url.get(url)
+            if photo is None:
+                photo = self.photos_by_url[url] = Photo(self, url, self.executor.submit(self.download, url))
+        return photo
+    
+    def download(self, url):
+        digest = hashlib.sha256()
+        fd, filename = tempfile.mkstemp(dir=self.temp_dir, suffix=os.path.splitext(url.split("?")[0])[1])
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                with self.session.get(url, stream=True) as resp:
+                    if resp.status_code != 200:
+                        print("        Failed to download photo {}: HTTP {}".format(url, resp.status_code))
+                        os.remove(filename)
+                        return None
+                    for chunk in resp.iter_content(self.chunk_size):
+                        digest.update(chunk)
+                        f.write(chunk)
+        except Exception as e:
+            print("        Failed to download photo {}: {}".format(url, e))
+            os.remove(filename)
+            return None
+        
+        digest = digest.hexdigest()
+        with self.lock:
+            if digest in self.files_by_digest:
+                # Same image under a different URL, keep only the first copy
+                os.remove(filename)
+                return (self.files_by_digest[digest], digest)
+            self.files_by_digest[digest] = filename
+        return (filename, digest)
+    
+    def upload(self, pk, photo):
+        # Returns the @id of a new PartKeepr temp upload of the photo
+        result = photo.result()
+        if result is None:
+            return None
+        filename, digest = result
+        with open(filename, 'rb') as f:
+            response = pk.upload_temp_file(f)
+        if 'image' not in response:
+            print("        Failed to upload photo {}".format(photo.url))
+            return None
+        return response['image']['@id']
+    
+    def cleanup(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
@@ -0,0 +1,205 @@
+MISSING = object()
+
+
+class Interner:
+    # Shares equal strings and reference objects (categories, storage locations, ...) between records
+    def __init__(self):
+        self.strings = {}
+        self.refs = {}
+    
+    def string(self, value):
+        return self.strings.setdefault(value, value)
+    
+    def ref(self, value):
+        # Embedded references are treated as read-only and shared by @id
+        if not isinstance(value, dict) or '@id' not in value:
+            return self.value(value)
+        ref = self.refs.get(value['@id'])
+        if ref is None:
+            ref = self.refs[value['@id']] = dict([(self.string(k), self.value(v)) for k, v in value.items()])
+        return ref
+    
+    def value(self, value):
+        if isinstance(value, str):
+            return self.string(value)
+        if isinstance(value, list):
+            return [self.value(v) for v in value]
+        if isinstance(value, dict):
+            return dict([(self.string(k), self.value(v)) for k, v in value.items()])
+        return value
+
+
+def to_json(value):
+    # Converts records (also nested in lists and dicts) back to plain JSON data
+    if isinstance(value, Record):
+        return value.to_json()
+    if isinstance(value, list):
+        return [to_json(v) for v in value]
+    if isinstance(value, dict):
+        return dict([(k, to_json(v)) for k, v in value.items()])
+    return value
+
+
+class Record:
+    # Compact stand-in for a JSON-LD object. Known keys live in slots, everything else in 'extra'.
+    # Supports the dict-style access the tools use, so records and raw dicts can be mixed.
+    # FIELDS maps JSON keys to slot names, REFS and CHILDREN name the keys holding
+    # shared references and lists of nested records.
+    # Keys assigned through __setitem__ are remembered in 'changed' so only those need to be written back.
+    __slots__ = ('extra', 'changed')
+    FIELDS = {}
+    REFS = ()
+    CHILDREN = {}
+    
+    @classmethod
+    def from_json(cls, data, interner):
+        record = cls()
+        record.extra = None
+        record.changed = None
+        for key, value in data.items():
+            if key in cls.CHILDREN:
+                child_cls = cls.CHILDREN[key]
+                if value is not None:
+                    value = [child_cls.from_json(v, interner) if isinstance(v, dict) else interner.value(v) for v in value]
+            elif key in cls.REFS:
+                value = interner.ref(value)
+            else:
+                value = interner.value(value)
+            if key in cls.FIELDS:
+                setattr(record, cls.FIELDS[key], value)
+            else:
+                if record.extra is None:
+                    record.extra = {}
+                record.extra[interner.string(key)] = value
+        return record
+    
+    def to_json(self):
+        data = {}
+        for key, attr in self.FIELDS.items():
+            value = getattr(self, attr, MISSING)
+            if value is not MISSING:
+                data[key] = to_json(value)
+        if self.extra:
+            for key, value in self.extra.items():
+                data[key] = to_json(value)
+        return data
+    
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            value = getattr(self, self.FIELDS[key], MISSING)
+        elif self.extra is not None:
+            value = self.extra.get(key, MISSING)
+        else:
+            value = MISSING
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+    
+    def __setitem__(self, key, value):
+        if self.changed is None:
+            self.changed = set()
+        self.changed.add(key)
+        if key in self.FIELDS:
+            setattr(self, self.FIELDS[key], value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+    
+    def __contains__(self, key):
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+    
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+    
+    def get_changed_fields(self):
+        return sorted(self.changed or ())
+    
+    def clear_changed_fields(self):
+        self.changed = None
+
+
+class Parameter(Record):
+    __slots__ = ('id', 'type', 'name', 'description', 'value_type', 'string_value', 'value', 'unit', 'si_prefix')
+    FIELDS = {
+        '@id': 'id',
+        '@type': 'type',
+        'name': 'name',
+        'description': 'description',
+        'valueType': 'value_type',
+        'stringValue': 'string_value',
+        'value': 'value',
+        'unit': 'unit',
+        'siPrefix': 'si_prefix'
+    }
+    REFS = ('unit', 'siPrefix')
+
+
+class PartManufacturer(Record):
+    __slots__ = ('id', 'type', 'manufacturer', 'part_number')
+    FIELDS = {
+        '@id': 'id',
+        '@type': 'type',
+        'manufacturer': 'manufacturer',
+        'partNumber': 'part_number'
+    }
+    REFS = ('manufacturer',)
+
+
+class PartDistributor(Record):
+    __slots__ = ('id', 'type', 'distributor', 'order_number', 'packaging_unit', 'price', 'currency', 'sku', 'ignore_for_reports')
+    FIELDS = {
+        '@id': 'id',
+        '@type': 'type',
+        'distributor': 'distributor',
+        'orderNumber': 'order_number',
+        'packagingUnit': 'packaging_unit',
+        'price': 'price',
+        'currency': 'currency',
+        'sku': 'sku',
+        'ignoreForReports': 'ignore_for_reports'
+    }
+    REFS = ('distributor',)
+
+
+class Part(Record):
+    __slots__ = ('id', 'type', 'name', 'description', 'comment', 'stock_level', 'min_stock_level', 'average_price',
+        'status', 'needs_review', 'part_condition', 'production_remarks', 'create_date', 'internal_part_number',
+        'category', 'storage_location', 'footprint', 'part_unit', 'manufacturers', 'distributors', 'parameters', 'attachments')
+    FIELDS = {
+        '@id': 'id',
+        '@type': 'type',
+        'name': 'name',
+        'description': 'description',
+        'comment': 'comment',
+        'stockLevel': 'stock_level',
+        'minStockLevel': 'min_stock_level',
+        'averagePrice': 'average_price',
+        'status': 'status',
+        'needsReview': 'needs_review',
+        'partCondition': 'part_condition',
+        'productionRemarks': 'production_remarks',
+        'createDate': 'create_date',
+        'internalPartNumber': 'internal_part_number',
+        'category': 'category',
+        'storageLocation': 'storage_location',
+        'footprint': 'footprint',
+        'partUnit': 'part_unit',
+        'manufacturers': 'manufacturers',
+        'distributors': 'distributors',
+        'parameters': 'parameters',
+        'attachments': 'attachments'
+    }
+    REFS = ('category', 'storageLocation', 'footprint', 'partUnit')
+    CHILDREN = {
+        'manufacturers': PartManufacturer,
+        'distributors': PartDistributor,
+        'parameters': Parameter
+    }
@@ -0,0 +1,91 @@
+import threading
+import time
+
+from catalog import Catalog
+
+
+class ReferenceData:
+    # Name -> @id lookups for the small PartKeepr tables (manufacturers, distributors, part categories
+    # and storage locations). A table is loaded on first use and reloaded once it is older than ttl
+    # seconds; entities created or changed through the client are added in place in between.
+    # Tables are fetched without holding the lock, so lookups of other tables are not blocked;
+    # changes recorded while a table is fetched are applied to the fetched table.
+    def __init__(self, pk, ttl=3600):
+        self.pk = pk
+        self.ttl = ttl
+        self.lock = threading.RLock()
+        self.ids_by_name = {}
+        self.loaded_at = {}
+        self.refresh_locks = {}
+        # table -> list of (entity_id, name) changes recorded during a fetch, name None for removals
+        self.pending_changes = {}
+    
+    def is_stale(self, table):
+        loaded_at = self.loaded_at.get(table)
+        return loaded_at is None or (self.ttl is not None and time.time() - loaded_at > self.ttl)
+    
+    def refresh(self, table):
+        with self.lock:
+            self.pending_changes[table] = []
+        try:
+            print("Getting {}".format(table.replace("_", " ")))
+            entities = self.pk.get_cached_paged(table)
+        except:
+            with self.lock:
+                del self.pending_changes[table]
+            raise
+        ids_by_name = dict([(entity['name'].lower(), entity['@id']) for entity in entities])
+        with self.lock:
+            for entity_id, name in self.pending_changes.pop(table):
+                self.apply_change(ids_by_name, entity_id, name)
+            self.ids_by_name[table] = ids_by_name
+            self.loaded_at[table] = time.time()
+    
+    def get_ids_by_name(self, table):
+        # The returned dict is shared, entries added while creating entities are visible to all users
+        with self.lock:
+            if not self.is_stale(table):
+                return self.ids_by_name[table]
+            refresh_lock = self.refresh_locks.setdefault(table, threading.Lock())
+        # Only one caller fetches a table, the others wait for it and use its result
+        with refresh_lock:
+            with self.lock:
+                stale = self.is_stale(table)
+            if stale:
+                self.refresh(table)
+        with self.lock:
+            return self.ids_by_name[table]
+    
+    def get_id(self, table, name):
+        return self.get_ids_by_name(table).get(name.lower())
+    
+    @staticmethod
+    def apply_change(ids_by_name, entity_id, name):
+        if name is not None:
+            ids_by_name[name.lower()] = entity_id
+            return
+        for name, id in list(ids_by_name.items()):
+            if id == entity_id:
+                del ids_by_name[name]
+    
+    def record_change(self, table, entity_id, name):
+        with self.lock:
+            if table in self.pending_changes:
+                self.pending_changes[table].append((entity_id, name))
+            if table in self.ids_by_name:
+                self.apply_change(self.ids_by_name[table], entity_id, name)
+    
+    def update(self, entity):
+        # Accepts any API result, only entities of loaded tables with a name are recorded
+        if entity.get('name'):
+            self.record_change(Catalog.get_collection(entity['@id']), entity['@id'], entity['name'])
+    
+    def remove(self, entity_id):
+        self.record_change(Catalog.get_collection(entity_id), entity_id, None)
+    
+    def invalidate(self, table=None):
+        with self.lock:
+            if table is None:
+                self.loaded_at.clear()
+            else:
+                self.loaded_at.pop(table, None)
@@ -0,0 +1,72 @@
+import json
+import sqlite3
+import threading
+import time
+
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+# Maximum age in seconds of cached distributor responses by kind of data.
+# 'part' is used for responses that contain everything including prices.
+DEFAULT_TTLS = {
+    'details': 14 * DAY,
+    'parameters': 14 * DAY,
+    'prices': 6 * HOUR,
+    'part': 6 * HOUR
+}
+
+
+class ResponseCache:
+    # On-disk cache of distributor API responses, keyed by distributor, kind of data and order number
+    def __init__(self, filename, ttls=None, max_entries=100000, bypass=False):
+        self.filename = filename
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.max_entries = max_entries
+        # With bypass set, lookups always miss but fresh responses are still stored
+        self.bypass = bypass
+        self.puts_since_eviction = 0
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS responses (distributor TEXT NOT NULL, kind TEXT NOT NULL, key TEXT NOT NULL, data TEXT NOT NULL, stored_at REAL NOT NULL, accessed_at REAL NOT NULL, PRIMARY KEY (distributor, kind, key))")
+            self.db.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def get(self, distributor, kind, key):
+        if self.bypass:
+            return None
+        now = time.time()
+        with self.lock, self.db:
+            row = self.db.execute("SELECT data, stored_at FROM responses WHERE distributor = ? AND kind = ? AND key = ?", (distributor, kind, key)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttls[kind]:
+                self.db.execute("DELETE FROM responses WHERE distributor = ? AND kind = ? AND key = ?", (distributor, kind, key))
+                return None
+            self.db.execute("UPDATE responses SET accessed_at = ? WHERE distributor = ? AND kind = ? AND key = ?", (now, distributor, kind, key))
+        return json.loads(row[0])
+
+    def put(self, distributor, kind, key, data):
+        now = time.time()
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO responses (distributor, kind, key, data, stored_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)", (distributor, kind, key, json.dumps(data), now, now))
+            self.puts_since_eviction += 1
+            # Checking the size on every write would be wasteful, allow a little overshoot
+            if self.puts_since_eviction >= max(1, self.max_entries // 100):
+                self.puts_since_eviction = 0
+                self.evict()
+
+    def evict(self):
+        # Expects the lock to be held. Drops expired entries, then the least recently used ones.
+        now = time.time()
+        for kind, ttl in self.ttls.items():
+            self.db.execute("DELETE FROM responses WHERE kind = ? AND stored_at < ?", (kind, now - ttl))
+        count = self.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self.max_entries:
+            self.db.execute("DELETE FROM responses WHERE rowid IN (SELECT rowid FROM responses ORDER BY accessed_at LIMIT ?)", (count - self.max_entries,))
@@ -0,0 +1,503 @@
+import copy
+import json
+import os
+import random
+import re
+import threading
+import time
+import urllib.parse
+
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Response templates for one product of each distributor API. Strings consisting of a single
+# placeholder like "{price}" are replaced by the raw value, other placeholders are substituted
+# as text. A fixture directory can override any of them with a recorded response (<name>.json).
+DEFAULT_FIXTURES = {
+    'tme_product': {
+        'Symbol': "{order_no}",
+        'OriginalSymbol': "{mpn}",
+        'Producer': "{manufacturer}",
+        'Description': "{description}",
+        'Photo': "//{host}/photos/{photo}.jpg"
+    },
+    'tme_prices': {
+        'Symbol': "{order_no}",
+        'PriceList': [
+            {'Amount': 1, 'PriceValue': "{price}"},
+            {'Amount': 100, 'PriceValue': "{bulk_price}"}
+        ]
+    },
+    'tme_parameters': {
+        'Symbol': "{order_no}",
+        'ParameterList': [
+            {'ParameterName': "Resistance", 'ParameterValue': "{value}"},
+            {'ParameterName': "Tolerance", 'ParameterValue': "1%"},
+            {'ParameterName': "Case - inch", 'ParameterValue': "0603"}
+        ]
+    },
+    'mouser_part': {
+        'MouserPartNumber': "{order_no}",
+        'ManufacturerPartNumber': "{mpn}",
+        'Manufacturer': "{manufacturer}",
+        'Description': "{description}",
+        'ImagePath': "http://{host}/photos/{photo}.jpg",
+        'PriceBreaks': [
+            {'Quantity': 1, 'Price': "{price_text} €"},
+            {'Quantity': 100, 'Price': "{bulk_price_text} €"}
+        ]
+    },
+    'digikey_product': {
+        'DigiKeyPartNumber': "{order_no}",
+        'ManufacturerPartNumber': "{mpn}",
+        'Manufacturer': {'Value': "{manufacturer}"},
+        'ProductDescription': "{description}",
+        'PrimaryPhoto': "http://{host}/photos/{photo}.jpg",
+        'StandardPricing': [
+            {'BreakQuantity': 1, 'UnitPrice': "{price}"},
+            {'BreakQuantity': 100, 'UnitPrice': "{bulk_price}"}
+        ],
+        'Parameters': [
+            {'Parameter': "Capacitance", 'Value': "{value}"},
+            {'Parameter': "Voltage - Rated", 'Value': "50V"}
+        ]
+    },
+    'lcsc_product': {
+        'productCode': "{order_no}",
+        'productModel': "{mpn}",
+        'brandNameEn': "{manufacturer}",
+        'productIntroEn': "{description}",
+        'productImages': ["http://{host}/photos/{photo}.jpg"],
+        'productPriceList': [
+            {'ladder': 1, 'currencyPrice': "{price}"},
+            {'ladder': 100, 'currencyPrice': "{bulk_price}"}
+        ],
+        'paramVOList': [
+            {'paramNameEn': "Resistance", 'paramValueEn': "{value}"}
+        ]
+    }
+}
+
+DISTRIBUTOR_NAMES = ("TME", "Mouser", "Digi-Key", "LCSC")
+CATEGORY_NAMES = ("Resistors", "Ceramic Caps", "Electrolytic Caps", "Tantalum Caps", "Fuses", "Diodes", "Transistors", "ICs", "Connectors", "Inductors")
+
+
+class Fixtures:
+    def __init__(self, directory=None):
+        self.templates = copy.deepcopy(DEFAULT_FIXTURES)
+        if directory:
+            for name in self.templates:
+                filename = os.path.join(directory, name + ".json")
+                if os.path.exists(filename):
+                    with open(filename, 'r', encoding='utf-8') as f:
+                        self.templates[name] = json.load(f)
+    
+    def render(self, name, values):
+        return self.fill(self.templates[name], values)
+    
+    def fill(self, template, values):
+        if isinstance(template, str):
+            match = re.fullmatch(r"\{(\w+)\}", template)
+            if match and match.group(1) in values:
+                return values[match.group(1)]
+            return re.sub(r"\{(\w+)\}", lambda m: str(values.get(m.group(1), m.group(0))), template)
+        if isinstance(template, list):
+            return [self.fill(v, values) for v in template]
+        if isinstance(template, dict):
+            return dict([(k, self.fill(v, values)) for k, v in template.items()])
+        return template
+
+
+def get_product_values(order_no, host):
+    # Deterministic product data per order number, so repeated runs see the same catalog
+    rng = random.Random(order_no)
+    price = round(rng.uniform(0.001, 2.0), 5)
+    return {
+        'order_no': order_no,
+        'mpn': "MPN-" + order_no.split("-")[-1],
+        'manufacturer': "Manufacturer {}".format(rng.randrange(60)),
+        'description': "Synthetic part {}".format(order_no),
+        'value': "{}k".format(rng.randrange(1, 1000)),
+        'price': price,
+        'bulk_price': round(price * 0.8, 5),
+        'price_text': "{:.5f}".format(price).replace(".", ","),
+        'bulk_price_text': "{:.5f}".format(price * 0.8).replace(".", ","),
+        'photo': rng.randrange(16),
+        'host': host
+    }
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, without this keep-alive clients see delayed ACK stalls
+    disable_nagle_algorithm = True
+    
+    def do_GET(self):
+        self.server.dispatch(self, "GET")
+    
+    def do_POST(self):
+        self.server.dispatch(self, "POST")
+    
+    def do_PUT(self):
+        self.server.dispatch(self, "PUT")
+    
+    def do_DELETE(self):
+        self.server.dispatch(self, "DELETE")
+    
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    # Local HTTP stand-in for one of the APIs. Every request is delayed by latency plus up to
+    # jitter seconds, and rate_limit=(requests, period) answers excess requests with 429 and
+    # Retry-After like the real APIs do. The time spent per request is recorded per endpoint.
+    daemon_threads = True
+    
+    def __init__(self, name, fixtures=None, latency=0.0, jitter=0.0, rate_limit=None):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.name = name
+        self.fixtures = fixtures or Fixtures()
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.routes = []
+        self.lock = threading.Lock()
+        self.request_times = deque()
+        self.durations = {}
+        self.rejected = {}
+        self.thread = None
+    
+    @property
+    def host(self):
+        return "127.0.0.1:{}".format(self.server_address[1])
+    
+    @property
+    def url(self):
+        return "http://" + self.host
+    
+    def route(self, method, pattern, handler, endpoint=None):
+        # endpoint names the route in the statistics, by default numeric IDs are replaced by {id}
+        self.routes.append((method, re.compile(pattern + "$"), handler, endpoint))
+    
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+    
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+    
+    def allow_request(self):
+        if not self.rate_limit:
+            return True
+        count, period = self.rate_limit
+        now = time.monotonic()
+        with self.lock:
+            while self.request_times and self.request_times[0] <= now - period:
+                self.request_times.popleft()
+            if len(self.request_times) >= count:
+                return False
+            self.request_times.append(now)
+            return True
+    
+    def dispatch(self, request, method):
+        start = time.monotonic()
+        url = urllib.parse.urlsplit(request.path)
+        length = int(request.headers.get('Content-Length', 0))
+        body = request.rfile.read(length) if length else b""
+        endpoint = "{} {}".format(method, re.sub(r"/\d+(?=/|$)", "/{id}", url.path))
+        
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+        allowed = self.allow_request()
+        if not allowed:
+            self.send(request, 429, {'message': "Rate limit exceeded"}, {'Retry-After': "1"})
+        else:
+            for route_method, pattern, handler, route_endpoint in self.routes:
+                match = pattern.match(url.path)
+                if route_method == method and match:
+                    if route_endpoint:
+                        endpoint = "{} {}".format(method, route_endpoint)
+                    query = dict(urllib.parse.parse_qsl(url.query))
+                    try:
+                        result = handler(request, query, body, *match.groups())
+                    except Exception as e:
+                        result = (500, {'message': str(e)})
+                    self.send(request, *result)
+                    break
+            else:
+                self.send(request, 404, {'message': "Not found"})
+        
+        with self.lock:
+            self.durations.setdefault(endpoint, []).append(time.monotonic() - start)
+            if not allowed:
+                self.rejected[endpoint] = self.rejected.get(endpoint, 0) + 1
+    
+    def send(self, request, status, data, headers=None):
+        if isinstance(data, bytes):
+            content, content_type = data, "application/octet-stream"
+        else:
+            content, content_type = json.dumps(data).encode('utf-8'), "application/json"
+        request.send_response(status)
+        request.send_header('Content-Type', content_type)
+        request.send_header('Content-Length', str(len(content)))
+        for key, value in (headers or {}).items():
+            request.send_header(key, value)
+        request.end_headers()
+        request.wfile.write(content)
+    
+    def reset_stats(self):
+        with self.lock:
+            self.durations = {}
+            self.rejected = {}
+    
+    def get_stats(self):
+        # (endpoint, count, rejected, p50, p99) of the requests handled so far
+        with self.lock:
+            durations = dict([(endpoint, sorted(times)) for endpoint, times in self.durations.items()])
+            rejected = dict(self.rejected)
+        return [(endpoint, len(times), rejected.get(endpoint, 0), get_percentile(times, 0.5), get_percentile(times, 0.99)) for endpoint, times in sorted(durations.items())]
+
+
+def get_percentile(sorted_values, percentile):
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(percentile * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def photo_handler(request, query, body, photo):
+    # A few distinct images, so the photo pipeline sees shared photos like in the real catalogs
+    return (200, b"\xff\xd8\xff\xe0" + photo.encode('ascii') * 1024 + b"\xff\xd9")
+
+
+class TMEStandIn(StandInServer):
+    def __init__(self, **kwargs):
+        super().__init__("TME", **kwargs)
+        self.route("POST", r"/Products/GetProducts\.json", lambda *args: self.products(*args, fixture='tme_product'))
+        self.route("POST", r"/Products/GetPrices\.json", lambda *args: self.products(*args, fixture='tme_prices'))
+        self.route("POST", r"/Products/GetParameters\.json", lambda *args: self.products(*args, fixture='tme_parameters'))
+        self.route("GET", r"/photos/(\w+)\.jpg", photo_handler, "/photos/{photo}")
+    
+    def products(self, request, query, body, fixture):
+        params = dict(urllib.parse.parse_qsl(body.decode('utf-8')))
+        symbols = [value for key, value in params.items() if key.startswith("SymbolList[")]
+        products = [self.fixtures.render(fixture, get_product_values(symbol, self.host)) for symbol in symbols]
+        return (200, {'Status': "OK", 'Data': {'ProductList': products}})
+
+
+class MouserStandIn(StandInServer):
+    def __init__(self, **kwargs):
+        super().__init__("Mouser", **kwargs)
+        self.route("POST", r"/api/v2/search/partnumber", self.search)
+        self.route("GET", r"/photos/(\w+)\.jpg", photo_handler, "/photos/{photo}")
+    
+    def search(self, request, query, body):
+        part_numbers = json.loads(body)['SearchByPartRequest']['mouserPartNumber'].split("|")
+        parts = [self.fixtures.render('mouser_part', get_product_values(part_no, self.host)) for part_no in part_numbers]
+        return (200, {'Errors': [], 'SearchResults': {'NumberOfResult': len(parts), 'Parts': parts}})
+
+
+class DigiKeyStandIn(StandInServer):
+    def __init__(self, **kwargs):
+        super().__init__("Digi-Key", **kwargs)
+        self.route("POST", r"/v1/oauth2/token", self.token)
+        self.route("GET", r"/Search/v3/Products/(.+)", self.product, "/Search/v3/Products/{order_no}")
+        self.route("GET", r"/photos/(\w+)\.jpg", photo_handler, "/photos/{photo}")
+    
+    def token(self, request, query, body):
+        return (200, {'access_token': "stand-in-token", 'refresh_token': "stand-in-refresh", 'expires_in': 1800})
+    
+    def product(self, request, query, body, order_no):
+        order_no = urllib.parse.unquote(order_no)
+        return (200, self.fixtures.render('digikey_product', get_product_values(order_no, self.host)))
+
+
+class LCSCStandIn(StandInServer):
+    def __init__(self, **kwargs):
+        super().__init__("LCSC", **kwargs)
+        self.route("GET", r"/wmsc/product/detail", self.product)
+        self.route("GET", r"/photos/(\w+)\.jpg", photo_handler, "/photos/{photo}")
+    
+    def product(self, request, query, body):
+        result = self.fixtures.render('lcsc_product', get_product_values(query['productCode'], self.host))
+        return (200, {'code': 200, 'msg': "", 'result': result})
+
+
+class PartKeeprStandIn(StandInServer):
+    # Hydra API over an in-memory synthetic catalog. Embedded references are resolved like
+    # the real server does, so the tools see the same document shapes.
+    ITEMS_PER_PAGE = 50
+    
+    def __init__(self, num_parts, parts_per_location=5, seed=0, **kwargs):
+        super().__init__("PartKeepr", **kwargs)
+        self.data_lock = threading.RLock()
+        self.collections = {}
+        self.next_ids = {}
+        # Temp uploads not attached yet, attaching one moves it to the part like the real server does
+        self.temp_uploads = set()
+        self.make_catalog(num_parts, parts_per_location, random.Random(seed))
+        self.route("POST", r"/api/users/login", lambda *args: (200, {'@id': "/api/users/1", 'username': "benchmark"}))
+        self.route("POST", r"/api/temp_uploaded_files/upload", self.upload)
+        self.route("PUT", r"/api/parts/(\d+)/(addStock|removeStock|setStock)", self.change_stock)
+        self.route("GET", r"/api/(\w+)", self.get_collection)
+        self.route("GET", r"/api/(\w+)/(\d+)", self.get_entity)
+        self.route("POST", r"/api/(\w+)", self.create_entity)
+        self.route("PUT", r"/api/(\w+)/(\d+)", self.update_entity)
+        self.route("DELETE", r"/api/(\w+)/(\d+)", self.delete_entity)
+    
+    def add(self, collection, entity):
+        num_id = self.next_ids.get(collection, 1)
+        self.next_ids[collection] = num_id + 1
+        entity['@id'] = "/api/{}/{}".format(collection, num_id)
+        self.collections.setdefault(collection, {})[num_id] = entity
+        return entity
+    
+    def make_catalog(self, num_parts, parts_per_location, rng):
+        distributors = [self.add('distributors', {'@type': "Distributor", 'name': name}) for name in DISTRIBUTOR_NAMES]
+        manufacturers = [self.add('manufacturers', {'@type': "Manufacturer", 'name': "Manufacturer {}".format(i)}) for i in range(40)]
+        categories = [self.add('part_categories', {'@type': "PartCategory", 'name': name}) for name in CATEGORY_NAMES]
+        locations = [self.add('storage_locations', {'@type': "StorageLocation", 'name': "Box {:05d}".format(i)}) for i in range(max(1, num_parts // parts_per_location))]
+        for i in range(num_parts):
+            distributor = distributors[i % len(distributors)]
+            part_distributor = self.add('part_distributors', {
+                '@type': "PartDistributor",
+                'distributor': distributor,
+                'orderNumber': "{}-{:06d}".format(distributor['name'].upper(), i),
+                'packagingUnit': 1,
+                'price': "{:.5f}".format(rng.uniform(0.001, 2.0)),
+                'currency': "EUR"
+            })
+            part_manufacturers = []
+            if rng.random() < 0.5:
+                part_manufacturers.append(self.add('part_manufacturers', {
+                    '@type': "PartManufacturer",
+                    'manufacturer': rng.choice(manufacturers),
+                    'partNumber': "MPN-{:06d}".format(i)
+                }))
+            self.add('parts', {
+                '@type': "Part",
+                'name': "Part {:06d}".format(i),
+                'description': "",
+                'comment': "",
+                'stockLevel': rng.randrange(200),
+                'minStockLevel': 0,
+                'category': rng.choice(categories),
+                'storageLocation': locations[i // parts_per_location % len(locations)],
+                'createDate': "2020-01-01T00:00:00+00:00",
+                'manufacturers': part_manufacturers,
+                'distributors': [part_distributor],
+                'parameters': [],
+                'attachments': []
+            })
+    
+    def resolve(self, value):
+        # {'@id': ...} references to stored entities are replaced by the entities themselves
+        if isinstance(value, list):
+            return [self.resolve(v) for v in value]
+        if isinstance(value, dict):
+            if '@id' in value:
+                collection, num_id = value['@id'].split("/")[2:4]
+                if collection == 'temp_images':
+                    if value['@id'] not in self.temp_uploads:
+                        raise ValueError("Temp upload {} does not exist".format(value['@id']))
+                    self.temp_uploads.remove(value['@id'])
+                    return self.add('part_attachments', {'@type': "PartAttachment", 'isImage': True, 'originalFilename': value['@id']})
+                entity = self.collections.get(collection, {}).get(int(num_id))
+                if entity is not None:
+                    if len(value) > 1:
+                        entity.update(dict([(k, self.resolve(v)) for k, v in value.items() if k != '@id']))
+                    return entity
+            return dict([(k, self.resolve(v)) for k, v in value.items()])
+        return value
+    
+    def matches(self, entity, filters):
+        for filter in filters:
+            values = [entity]
+            for key in filter['property'].split("."):
+                next_values = []
+                for value in values:
+                    value = value.get(key) if isinstance(value, dict) else None
+                    next_values.extend(value if isinstance(value, list) else [value])
+                values = next_values
+            if filter['operator'] == "=" and filter['value'] not in values:
+                return False
+            if filter['operator'] == ">=" and not any(v is not None and v >= filter['value'] for v in values):
+                return False
+        return True
+    
+    def get_collection(self, request, query, body, collection):
+        page = int(query.get('page', 1))
+        filters = json.loads(query['filter']) if 'filter' in query else []
+        with self.data_lock:
+            entities = [e for e in self.collections.get(collection, {}).values() if self.matches(e, filters)]
+            last_page = max(1, (len(entities) + self.ITEMS_PER_PAGE - 1) // self.ITEMS_PER_PAGE)
+            members = entities[(page - 1) * self.ITEMS_PER_PAGE:page * self.ITEMS_PER_PAGE]
+            data = {
+                '@id': "/api/" + collection,
+                'hydra:member': json.loads(json.dumps(members)),
+                'hydra:totalItems': len(entities),
+                'hydra:lastPage': "/api/{}?page={}".format(collection, last_page)
+            }
+        if page < last_page:
+            data['hydra:nextPage'] = "/api/{}?page={}".format(collection, page + 1)
+        return (200, data)
+    
+    def get_entity(self, request, query, body, collection, num_id):
+        with self.data_lock:
+            entity = self.collections.get(collection, {}).get(int(num_id))
+            if entity is None:
+                return (404, {'@type': "hydra:Error", 'hydra:description': "Not found"})
+            return (200, json.loads(json.dumps(entity)))
+    
+    def create_entity(self, request, query, body, collection):
+        data = json.loads(body)
+        with self.data_lock:
+            entity = self.add(collection, dict([(k, self.resolve(v)) for k, v in data.items() if k != '@id']))
+            entity.setdefault('createDate', time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime()))
+            if collection == 'parts':
+                for key in ('manufacturers', 'distributors', 'parameters', 'attachments'):
+                    entity.setdefault(key, [])
+                entity.setdefault('stockLevel', 0)
+                entity.setdefault('description', "")
+            return (201, json.loads(json.dumps(entity)))
+    
+    def update_entity(self, request, query, body, collection, num_id):
+        # Like the real API, properties missing from the document are left untouched
+        data = json.loads(body)
+        with self.data_lock:
+            entity = self.collections.get(collection, {}).get(int(num_id))
+            if entity is None:
+                return (404, {'@type': "hydra:Error", 'hydra:description': "Not found"})
+            for key, value in data.items():
+                if key != '@id':
+                    entity[key] = self.resolve(value)
+            return (200, json.loads(json.dumps(entity)))
+    
+    def delete_entity(self, request, query, body, collection, num_id):
+        with self.data_lock:
+            self.collections.get(collection, {}).pop(int(num_id), None)
+        return (204, b"")
+    
+    def change_stock(self, request, query, body, num_id, action):
+        quantity = json.loads(body)['quantity']
+        with self.data_lock:
+            part = self.collections['parts'][int(num_id)]
+            if action == 'addStock':
+                part['stockLevel'] += quantity
+            elif action == 'removeStock':
+                part['stockLevel'] -= quantity
+            else:
+                part['stockLevel'] = quantity
+            return (200, json.loads(json.dumps(part)))
+    
+    def upload(self, request, query, body):
+        with self.data_lock:
+            num_id = self.next_ids.get('temp_images', 1)
+            self.next_ids['temp_images'] = num_id + 1
+            upload_id = "/api/temp_images/{}".format(num_id)
+            self.temp_uploads.add(upload_id)
+        return (200, {'image': {'@id': upload_id}})
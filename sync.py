@@ -0,0 +1,218 @@
+import sqlite3
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from distributor_common import SUPPORTED_DISTRIBUTORS, BATCH_SIZES, get_part_data, get_parts_data
+from write_queue import WriteQueue
+
+
+class SyncJournal:
+    # Records per part ID when it was last synced and with which outcome ('ok', 'error' or 'skipped'),
+    # so interrupted or incremental syncs only process the parts that still need it.
+    # Parts are recorded for every sync, but only syncs that call start_run() can be resumed.
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.run_started_at = None
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS parts (part_id TEXT PRIMARY KEY, synced_at REAL NOT NULL, outcome TEXT NOT NULL)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS runs (started_at REAL PRIMARY KEY, finished INTEGER NOT NULL DEFAULT 0)")
+    
+    def close(self):
+        with self.lock:
+            self.db.close()
+    
+    def get_unfinished_run(self):
+        with self.lock:
+            row = self.db.execute("SELECT started_at FROM runs WHERE finished = 0 ORDER BY started_at DESC LIMIT 1").fetchone()
+        return row[0] if row else None
+    
+    def start_run(self, resume=False):
+        started_at = self.get_unfinished_run() if resume else None
+        if started_at is None:
+            started_at = time.time()
+            with self.lock, self.db:
+                # A fresh run abandons any earlier unfinished one
+                self.db.execute("UPDATE runs SET finished = 1 WHERE finished = 0")
+                self.db.execute("INSERT INTO runs (started_at) VALUES (?)", (started_at,))
+        self.run_started_at = started_at
+    
+    def finish_run(self):
+        if self.run_started_at is None:
+            return
+        with self.lock, self.db:
+            self.db.execute("UPDATE runs SET finished = 1 WHERE started_at = ?", (self.run_started_at,))
+    
+    def record(self, part, outcome):
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO parts (part_id, synced_at, outcome) VALUES (?, ?, ?)", (part['@id'], time.time(), outcome))
+    
+    def select_parts(self, parts, resume=False, stale_after=None):
+        # resume: skip parts completed since the start of the last unfinished run
+        # stale_after: skip parts completed less than stale_after seconds ago
+        min_synced_at = None
+        if resume:
+            min_synced_at = self.get_unfinished_run()
+            if min_synced_at is None:
+                print("No unfinished sync to resume, starting from scratch")
+        if stale_after is not None:
+            min_synced_at = max(min_synced_at or 0, time.time() - stale_after)
+        if min_synced_at is None:
+            return parts
+        
+        with self.lock:
+            rows = self.db.execute("SELECT part_id FROM parts WHERE outcome != 'error' AND synced_at >= ?", (min_synced_at,)).fetchall()
+        done = set([row[0] for row in rows])
+        selected = [part for part in parts if part['@id'] not in done]
+        print("Skipping {} parts that are already up to date".format(len(parts) - len(selected)))
+        return selected
+
+
+class DistributorSync:
+    # Fetches distributor data for several parts at once (one worker pool per distributor,
+    # throttled by the rate limiters of the distributor clients) and writes the results
+    # to PartKeepr through a write queue as soon as all distributors of a part are done.
+    # The journal, if any, is closed at the end of the run.
+    def __init__(self, pk, tme, mouser, digikey, lcsc, fetch_workers=2, write_workers=4, max_pending_parts=None, journal=None):
+        self.pk = pk
+        self.journal = journal
+        self.clients = (tme, mouser, digikey, lcsc)
+        self.fetch_workers = fetch_workers
+        self.write_workers = write_workers
+        self.max_pending_parts = max_pending_parts or 4 * (fetch_workers * len(SUPPORTED_DISTRIBUTORS) + write_workers)
+        self.errors = []
+        self.errors_lock = threading.Lock()
+    
+    def add_error(self, part):
+        with self.errors_lock:
+            self.errors.append(part['name'])
+    
+    def fetch(self, distributor_name, order_no):
+        # Returns part data keyed by order number, like fetch_batch
+        try:
+            return {order_no: get_part_data(distributor_name, order_no, *self.clients)}
+        except Exception as e:
+            print("      Exception while getting part data for {}: {}".format(order_no, e))
+            return {order_no: None}
+    
+    def fetch_batch(self, distributor_name, order_nos):
+        try:
+            return get_parts_data(distributor_name, order_nos, *self.clients)
+        except Exception as e:
+            print("      Exception while getting part data for {} {} parts: {}".format(len(order_nos), distributor_name, e))
+            return dict([(order_no, None) for order_no in order_nos])
+    
+    def submit_batches(self, parts, fetch_executors):
+        # Group the order numbers of distributors with batch lookups up front,
+        # the parts then simply wait for the batch containing their order number
+        order_nos_by_distributor = dict([(name, []) for name in BATCH_SIZES])
+        seen = set()
+        for part in parts:
+            for distributor in part['distributors']:
+                distributor_name = distributor['distributor']['name']
+                key = (distributor_name, distributor['orderNumber'])
+                if distributor_name in order_nos_by_distributor and key not in seen:
+                    seen.add(key)
+                    order_nos_by_distributor[distributor_name].append(distributor['orderNumber'])
+        
+        batch_futures = {}
+        for distributor_name, order_nos in order_nos_by_distributor.items():
+            batch_size = BATCH_SIZES[distributor_name]
+            for start in range(0, len(order_nos), batch_size):
+                chunk = order_nos[start:start + batch_size]
+                future = fetch_executors[distributor_name].submit(self.fetch_batch, distributor_name, chunk)
+                for order_no in chunk:
+                    batch_futures[(distributor_name, order_no)] = future
+        return batch_futures
+    
+    def write(self, part, fetches, manufacturer_ids_by_name):
+        try:
+            print("    Writing {}".format(part['name']))
+            failed = False
+            for distributor, future in fetches:
+                part_data = future.result().get(distributor['orderNumber'])
+                if not part_data:
+                    print("      Failed to get part data for {} from {}!".format(part['name'], distributor['distributor']['name']))
+                    failed = True
+                    continue
+                part = self.pk.update_part_data(part, part_data, distributor, manufacturer_ids_by_name)
+            if failed:
+                self.add_error(part)
+            self.record(part, 'error' if failed else 'ok')
+        except Exception as e:
+            print("      Exception while updating {}: {}".format(part['name'], e))
+            self.add_error(part)
+            self.record(part, 'error')
+    
+    def record(self, part, outcome):
+        if self.journal:
+            self.journal.record(part, outcome)
+    
+    def run(self, parts, manufacturer_ids_by_name):
+        fetch_executors = dict([(name, ThreadPoolExecutor(max_workers=self.fetch_workers)) for name in SUPPORTED_DISTRIBUTORS.values()])
+        write_queue = WriteQueue(workers=self.write_workers)
+        pending = threading.BoundedSemaphore(self.max_pending_parts)
+        
+        def submit_write(part, fetches, remaining, lock):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0] > 0:
+                    return
+            try:
+                future = write_queue.submit(part['@id'], self.write, part, fetches, manufacturer_ids_by_name, description=part['name'])
+            except Exception as e:
+                # The slot of the part has to be given back, otherwise the final wait never returns
+                print("      Exception while queueing {}: {}".format(part['name'], e))
+                self.add_error(part)
+                self.record(part, 'error')
+                pending.release()
+                return
+            future.add_done_callback(lambda f: pending.release())
+        
+        try:
+            batch_futures = self.submit_batches(parts, fetch_executors)
+            num_parts = len(parts)
+            for i, part in enumerate(parts):
+                print("  [{: 5d}/{: 5d}] Processing {}".format(i+1, num_parts, part['name']))
+                
+                fetch_jobs = []
+                for distributor in part['distributors']:
+                    distributor_name = distributor['distributor']['name']
+                    if distributor_name not in SUPPORTED_DISTRIBUTORS.values():
+                        print("    Skipping distributor {}".format(distributor_name))
+                        continue
+                    fetch_jobs.append((distributor, distributor_name))
+                if not fetch_jobs:
+                    self.record(part, 'skipped')
+                    continue
+                
+                pending.acquire()
+                fetches = []
+                remaining = [len(fetch_jobs)]
+                lock = threading.Lock()
+                for distributor, distributor_name in fetch_jobs:
+                    key = (distributor_name, distributor['orderNumber'])
+                    if key in batch_futures:
+                        future = batch_futures[key]
+                    else:
+                        future = fetch_executors[distributor_name].submit(self.fetch, distributor_name, distributor['orderNumber'])
+                    fetches.append((distributor, future))
+                # Callbacks are attached only once the list is complete so the write sees every fetch
+                for distributor, future in fetches:
+                    future.add_done_callback(lambda f, part=part, fetches=fetches, remaining=remaining, lock=lock: submit_write(part, fetches, remaining, lock))
+            
+            # Wait until every part has been written
+            for i in range(self.max_pending_parts):
+                pending.acquire()
+            if self.journal:
+                self.journal.finish_run()
+        finally:
+            for executor in fetch_executors.values():
+                executor.shutdown(wait=True)
+            write_queue.close()
+            if self.journal:
+                self.journal.close()
+        return self.errors
@@ -0,0 +1,85 @@
+import asyncio
+import threading
+import time
+
+from async_clients import AsyncClient, AsyncDistributors
+
+
+class SlowClient:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+        self.calls = []
+    
+    def lookup(self, value):
+        with self.lock:
+            self.calls.append(value)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.05)
+        with self.lock:
+            self.running -= 1
+        return value * 2
+
+
+def test_async_client_limits_concurrency():
+    client = SlowClient()
+    
+    async def main():
+        async_client = AsyncClient(client, max_concurrency=2)
+        return await asyncio.gather(*[async_client.lookup(i) for i in range(6)])
+    
+    assert asyncio.run(main()) == [0, 2, 4, 6, 8, 10]
+    assert client.max_running == 2
+
+
+def test_async_client_cancelled_calls_are_not_sent():
+    client = SlowClient()
+    
+    async def main():
+        async_client = AsyncClient(client, max_concurrency=1)
+        running = asyncio.ensure_future(async_client.lookup(1))
+        waiting = asyncio.ensure_future(async_client.lookup(2))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        assert await running == 2
+        await asyncio.sleep(0.1)
+    
+    asyncio.run(main())
+    assert client.calls == [1]
+
+
+class TMEClient:
+    def __init__(self, fail=None):
+        self.fail = fail
+        self.started = threading.Barrier(3, timeout=5)
+    
+    def response(self, kind, product):
+        # All three lookups have to be in flight at the same time to get past the barrier
+        self.started.wait()
+        if kind == self.fail:
+            return None
+        return {'Data': {'ProductList': [product]}}
+    
+    def get_part_details(self, order_no):
+        return self.response("details", {'Symbol': order_no, 'OriginalSymbol': "", 'Description': "Resistor", 'Producer': "Yageo"})
+    
+    def get_part_prices(self, order_no):
+        return self.response("prices", {'PriceList': [{'Amount': 1, 'PriceValue': 0.1}]})
+    
+    def get_part_parameters(self, order_no):
+        return self.response("parameters", {'ParameterList': [{'ParameterName': "Resistance", 'ParameterValue': "10k"}]})
+
+
+def test_tme_lookups_run_concurrently():
+    distributors = AsyncDistributors(TMEClient(), None, None, None)
+    part_data = asyncio.run(distributors.get_part_data("TME", "RC0603-10K"))
+    assert part_data['manufacturer_part_no'] == "RC0603-10K"
+    assert part_data['prices'] == [{'quantity': 1, 'price': 0.1}]
+    assert part_data['parameters'] == {'Resistance': "10k"}
+
+
+def test_tme_lookup_fails_if_any_call_fails():
+    distributors = AsyncDistributors(TMEClient(fail="prices"), None, None, None)
+    assert asyncio.run(distributors.get_part_data("TME", "RC0603-10K")) is None
@@ -0,0 +1,61 @@
+import time
+
+from catalog import Catalog
+from partkeepr import PartKeepr
+from reference_data import ReferenceData
+
+
+def make_parts(*names):
+    return [{'@id': "/api/parts/{}".format(i + 1), 'name': name} for i, name in enumerate(names)]
+
+
+def test_update_collection_rewrites_changed_and_removes_missing(tmp_path):
+    catalog = Catalog(str(tmp_path / "catalog.sqlite"))
+    catalog.replace_collection("parts", make_parts("a", "b", "c"), 1)
+    
+    # Part 1 unchanged, part 2 renamed, part 3 deleted on the server, part 4 added
+    parts = make_parts("a", "B", "c")[:2] + [{'@id': "/api/parts/4", 'name': "d"}]
+    assert catalog.update_collection("parts", parts, 2) == (2, 1)
+    assert catalog.get_all("parts") == parts
+    assert catalog.get("/api/parts/3") is None
+    assert catalog.get_last_sync("parts") == 2
+    
+    assert catalog.update_collection("parts", parts, 3) == (0, 0)
+    catalog.close()
+
+
+class PagingPartKeepr(PartKeepr):
+    # PartKeepr client without a server, collections are served from 'collections'
+    def __init__(self, catalog, collections):
+        self.catalog = catalog
+        self.collections = collections
+        self.reference_data = ReferenceData(self)
+        self.paged = []
+    
+    def iter_paged(self, url, params=None):
+        self.paged.append(url)
+        return iter(self.collections.get(url, []))
+
+
+def test_sync_catalog_only_pages_when_needed(tmp_path):
+    catalog = Catalog(str(tmp_path / "catalog.sqlite"))
+    pk = PagingPartKeepr(catalog, {"/api/parts": make_parts("a")})
+    pk.sync_catalog()
+    assert len(pk.paged) == len(Catalog.COLLECTIONS)
+    
+    # Served from the local copy
+    pk.paged = []
+    pk.sync_catalog(max_age=3600)
+    assert pk.paged == []
+    
+    pk.collections["/api/parts"] = make_parts("b")
+    for collection in Catalog.COLLECTIONS:
+        catalog.set_last_sync(collection, time.time() - 7200)
+    pk.sync_catalog(max_age=3600)
+    assert len(pk.paged) == len(Catalog.COLLECTIONS)
+    assert catalog.get_all("parts") == make_parts("b")
+    
+    pk.paged = []
+    pk.sync_catalog(full=True)
+    assert len(pk.paged) == len(Catalog.COLLECTIONS)
+    catalog.close()
@@ -0,0 +1,73 @@
+import threading
+import time
+
+from distributor_common import RateLimiter, get_part_data
+
+
+def test_rate_limiter_allows_burst_up_to_capacity():
+    limiter = RateLimiter(5, 1)
+    start = time.monotonic()
+    for i in range(5):
+        limiter.acquire()
+    assert time.monotonic() - start < 0.1
+
+
+def test_rate_limiter_waits_for_refill():
+    limiter = RateLimiter(5, 0.5)
+    for i in range(5):
+        limiter.acquire()
+    start = time.monotonic()
+    limiter.acquire()
+    # One call is refilled every 0.1 seconds
+    assert time.monotonic() - start >= 0.08
+
+
+def test_rate_limiter_shared_between_threads():
+    limiter = RateLimiter(10, 0.5)
+    
+    def worker():
+        for i in range(5):
+            limiter.acquire()
+    
+    start = time.monotonic()
+    threads = [threading.Thread(target=worker) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 10 calls from the bucket, the other 10 at 20 calls per second
+    assert time.monotonic() - start >= 0.45
+
+
+class TMEClient:
+    def __init__(self, fail=None):
+        self.fail = fail
+        # All three lookups have to be in flight at the same time to get past the barrier
+        self.started = threading.Barrier(3, timeout=5)
+    
+    def response(self, kind, product):
+        self.started.wait()
+        if kind == self.fail:
+            return None
+        return {'Data': {'ProductList': [product]}}
+    
+    def get_part_details(self, order_no):
+        return self.response("details", {'Symbol': order_no, 'OriginalSymbol': "", 'Description': "Resistor", 'Producer': "Yageo"})
+    
+    def get_part_prices(self, order_no):
+        return self.response("prices", {'PriceList': [{'Amount': 1, 'PriceValue': 0.1}]})
+    
+    def get_part_parameters(self, order_no):
+        return self.response("parameters", {'ParameterList': [{'ParameterName': "Resistance", 'ParameterValue': "10k"}]})
+
+
+def test_tme_lookups_sent_at_the_same_time():
+    part_data = get_part_data("TME", "RC0603-10K", TMEClient(), None, None, None)
+    assert part_data['manufacturer'] == "Yageo"
+    assert part_data['prices'] == [{'quantity': 1, 'price': 0.1}]
+    assert part_data['parameters'] == {'Resistance': "10k"}
+
+
+def test_tme_lookup_fails_if_any_call_fails():
+    for kind in ("details", "prices", "parameters"):
+        assert get_part_data("TME", "RC0603-10K", TMEClient(fail=kind), None, None, None) is None
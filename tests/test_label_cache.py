@@ -0,0 +1,43 @@
+from label_cache import LRUCache, RenderCache
+
+
+def test_lru_cache_drops_least_recently_used():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert [key for key, value in cache.items()] == ["a", "c"]
+
+
+def test_lru_cache_counts_hits_and_misses():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.get("a")
+    cache.get("b")
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_lru_cache_put_refreshes_existing_key():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.put("a", 3)
+    cache.put("c", 4)
+    assert cache.get("a") == 3
+    assert cache.get("b") is None
+
+
+def test_render_cache_saved_between_runs(tmp_path):
+    filename = str(tmp_path / "render.cache")
+    cache = RenderCache()
+    barcode = cache.get_barcode("A1", 20, 2)
+    cache.save(filename)
+    
+    loaded = RenderCache()
+    loaded.load(filename)
+    assert loaded.get_barcode("A1", 20, 2).tobytes() == barcode.tobytes()
+    assert loaded.barcodes.hits == 1
@@ -0,0 +1,75 @@
+import random
+
+from labels import LabelGeometry, LabelManifest, zpl_compress_row
+
+
+GEOMETRY = LabelGeometry(62, 100, 300, 30)
+JOBS = [
+    ("A1", [("1", "Resistors: 10k")]),
+    ("A2", [("2", "Resistors: 1k"), ("3", "Ceramic Caps: 100n")])
+]
+
+
+def test_manifest_reports_new_and_changed_labels(tmp_path):
+    manifest = LabelManifest(str(tmp_path / "manifest.json"))
+    assert manifest.get_changed(JOBS, GEOMETRY) == JOBS
+    manifest.update(JOBS, GEOMETRY)
+    assert manifest.get_changed(JOBS, GEOMETRY) == []
+    
+    changed = [JOBS[0], ("A2", [("2", "Resistors: 1k")])]
+    assert manifest.get_changed(changed, GEOMETRY) == [changed[1]]
+    # The geometry is part of every label
+    assert manifest.get_changed(JOBS, LabelGeometry(62, 100, 300, 20)) == JOBS
+
+
+def test_manifest_saved_between_runs(tmp_path):
+    filename = str(tmp_path / "manifest.json")
+    manifest = LabelManifest(filename)
+    manifest.update(JOBS, GEOMETRY)
+    manifest.save()
+    assert LabelManifest(filename).get_changed(JOBS, GEOMETRY) == []
+
+
+def test_manifest_prune_drops_removed_locations(tmp_path):
+    manifest = LabelManifest(str(tmp_path / "manifest.json"))
+    manifest.update(JOBS, GEOMETRY)
+    manifest.update(JOBS[:1], GEOMETRY)
+    assert sorted(manifest.hashes) == ["A1", "A2"]
+    manifest.update(JOBS[:1], GEOMETRY, prune=True)
+    assert sorted(manifest.hashes) == ["A1"]
+
+
+def zpl_decompress_row(encoded, previous, length):
+    if encoded == ":":
+        return previous
+    row = ""
+    count = 0
+    for c in encoded:
+        if "G" <= c <= "Y":
+            count += ord(c) - ord("G") + 1
+        elif "g" <= c <= "z":
+            count += (ord(c) - ord("g") + 1) * 20
+        elif c == ",":
+            row += "0" * (length - len(row))
+        else:
+            row += c * (count or 1)
+            count = 0
+    return row
+
+
+def test_zpl_compress_row():
+    assert zpl_compress_row("FFFF0000", None) == "JF,"
+    assert zpl_compress_row("A5", None) == "A5"
+    assert zpl_compress_row("0000", None) == ","
+    assert zpl_compress_row("F" * 25, None) == "gKF"
+    assert zpl_compress_row("F" * 420, None) == "zYFF"
+    assert zpl_compress_row("FF00", "FF00") == ":"
+
+
+def test_zpl_compress_row_round_trip():
+    rng = random.Random(1)
+    previous = None
+    for i in range(200):
+        row = "".join(rng.choice("00000FFA") * rng.randint(1, 50) for j in range(10))
+        assert zpl_decompress_row(zpl_compress_row(row, previous), previous, len(row)) == row
+        previous = row
@@ -0,0 +1,137 @@
+import threading
+
+from partkeepr import PartKeepr
+from records import Interner, Part
+
+
+def make_client():
+    # Only the pure helpers are used, so no server is needed
+    return PartKeepr.__new__(PartKeepr)
+
+
+def make_part():
+    return {
+        '@id': "/api/parts/1",
+        'description': "Resistor 10k",
+        'manufacturers': [{'manufacturer': {'@id': "/api/manufacturers/1", 'name': "Yageo"}, 'partNumber': "RC0603FR-0710KL"}],
+        'parameters': [{'name': "Resistance", 'stringValue': "10k"}],
+        'attachments': []
+    }
+
+
+def make_part_data(**kwargs):
+    part_data = {
+        'description': "Resistor 10k",
+        'manufacturer': "YAGEO",
+        'manufacturer_part_no': "RC0603FR-0710KL",
+        'parameters': {'Resistance': "10k"},
+        'photo': None,
+        'prices': [{'quantity': 1, 'price': 0.1}]
+    }
+    part_data.update(kwargs)
+    return part_data
+
+
+def test_fingerprint_unchanged_for_same_data():
+    pk = make_client()
+    part = make_part()
+    assert pk.get_part_fingerprint(part) == pk.get_part_data_fingerprint(part, make_part_data())
+    # Missing values from the distributor keep the stored ones
+    assert pk.get_part_fingerprint(part) == pk.get_part_data_fingerprint(part, make_part_data(description="", manufacturer=None, parameters=None))
+
+
+def test_fingerprint_changes_with_managed_fields():
+    pk = make_client()
+    part = make_part()
+    fingerprint = pk.get_part_fingerprint(part)
+    assert pk.get_part_data_fingerprint(part, make_part_data(description="Resistor 10 kOhm")) != fingerprint
+    assert pk.get_part_data_fingerprint(part, make_part_data(manufacturer_part_no="RC0603JR-0710KL")) != fingerprint
+    assert pk.get_part_data_fingerprint(part, make_part_data(manufacturer="Vishay")) != fingerprint
+    assert pk.get_part_data_fingerprint(part, make_part_data(parameters={'Tolerance': "1%"})) != fingerprint
+    assert pk.get_part_data_fingerprint(part, make_part_data(photo="photo.jpg")) != fingerprint
+
+
+def test_compare_part_data_prices():
+    pk = make_client()
+    part = make_part()
+    assert pk.compare_part_data(part, make_part_data(), {'price': "0.10000"}) == (True, True)
+    assert pk.compare_part_data(part, make_part_data(), {'price': 0.2}) == (True, False)
+    assert pk.compare_part_data(part, make_part_data(prices=[]), {'price': 0.2}) == (True, True)
+
+
+def test_compare_part_data_without_stored_price():
+    pk = make_client()
+    part = make_part()
+    assert pk.compare_part_data(part, make_part_data(), {'price': None}) == (True, False)
+    assert pk.compare_part_data(part, make_part_data(), {}) == (True, False)
+
+
+class UpdatingPartKeepr(PartKeepr):
+    # PartKeepr client without a server, PUTs are applied to 'entities'. A server with
+    # keeps_omitted set merges the sent fields like API Platform, otherwise it resets the others.
+    def __init__(self, entities, partial_updates=True, keeps_omitted=True, error=None):
+        self.entities = entities
+        self.partial_updates = partial_updates
+        self.partial_updates_verified = False
+        self.partial_updates_lock = threading.Lock()
+        self.keeps_omitted = keeps_omitted
+        self.error = error
+        self.sent = []
+    
+    def update(self, url, data, params=None):
+        self.sent.append(dict(data))
+        if self.error:
+            return self.error
+        if self.keeps_omitted:
+            self.entities[url].update(data)
+        else:
+            self.entities[url] = dict([(key, data.get(key)) for key in self.entities[url]])
+        return dict(self.entities[url])
+
+
+def make_server_part():
+    return {'@id': "/api/parts/1", 'name': "10k", 'description': "Resistor", 'comment': "Reel"}
+
+
+def test_update_fields_sends_only_changed_fields():
+    pk = UpdatingPartKeepr({"/api/parts/1": make_server_part()})
+    part = Part.from_json(make_server_part(), Interner())
+    part['name'] = "10k 1%"
+    result = pk.update_fields(part)
+    assert pk.sent == [{'name': "10k 1%"}]
+    assert result['comment'] == "Reel"
+    assert pk.partial_updates_verified
+    assert part.get_changed_fields() == []
+
+
+def test_update_fields_falls_back_to_full_entities():
+    pk = UpdatingPartKeepr({"/api/parts/1": make_server_part()}, keeps_omitted=False)
+    part = make_server_part()
+    part['name'] = "10k 1%"
+    result = pk.update_fields(part, ['name'])
+    # The partial update reset the other fields, the full update restored them
+    assert pk.sent == [{'name': "10k 1%"}, part]
+    assert result == part
+    assert not pk.partial_updates
+    
+    pk.update_fields(part, ['comment'])
+    assert pk.sent[-1] == part
+
+
+def test_update_fields_partial_updates_are_opt_in():
+    pk = UpdatingPartKeepr({"/api/parts/1": make_server_part()}, partial_updates=False)
+    part = make_server_part()
+    pk.update_fields(part, ['name'])
+    assert pk.sent == [part]
+
+
+def test_update_fields_returns_errors():
+    error = {'@type': "hydra:Error", 'hydra:description': "invalid"}
+    pk = UpdatingPartKeepr({"/api/parts/1": make_server_part()}, error=error)
+    part = Part.from_json(make_server_part(), Interner())
+    part['name'] = "10k 1%"
+    assert pk.update_fields(part) == error
+    # Not retried with the full entity and still marked as changed
+    assert pk.sent == [{'name': "10k 1%"}]
+    assert part.get_changed_fields() == ['name']
+    assert pk.partial_updates and not pk.partial_updates_verified
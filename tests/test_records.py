@@ -0,0 +1,46 @@
+from records import Interner, Part
+
+
+PART = {
+    '@id': "/api/parts/1",
+    'name': "10k 1% 0603",
+    'category': {'@id': "/api/part_categories/2", 'name': "Resistors"},
+    'distributors': [{'@id': "/api/part_distributors/3", 'orderNumber': "RC0603FR-0710KL", 'distributor': {'@id': "/api/distributors/4", 'name': "TME"}}],
+    'customField': "kept"
+}
+
+
+def test_interner_shares_strings_and_refs():
+    interner = Interner()
+    a = Part.from_json(PART, interner)
+    b = Part.from_json(dict(PART, name="".join(["10k 1%", " 0603"])), interner)
+    assert a['name'] is b['name']
+    assert a['category'] is b['category']
+    assert a['distributors'][0]['distributor'] is b['distributors'][0]['distributor']
+
+
+def test_record_round_trip():
+    part = Part.from_json(PART, Interner())
+    assert part.to_json() == PART
+    assert part['customField'] == "kept"
+    assert 'missing' not in part
+    assert part.get('missing', 5) == 5
+
+
+def test_record_tracks_changed_fields():
+    part = Part.from_json(PART, Interner())
+    assert part.get_changed_fields() == []
+    part['name'] = "10k"
+    part['customField'] = "changed"
+    part['name'] = "10k 1%"
+    assert part.get_changed_fields() == ['customField', 'name']
+    assert part.to_json()['name'] == "10k 1%"
+    part.clear_changed_fields()
+    assert part.get_changed_fields() == []
+
+
+def test_nested_record_changes_are_separate():
+    part = Part.from_json(PART, Interner())
+    part['distributors'][0]['orderNumber'] = "X"
+    assert part.get_changed_fields() == []
+    assert part['distributors'][0].get_changed_fields() == ['orderNumber']
@@ -0,0 +1,77 @@
+import time
+
+from sync import SyncJournal
+
+
+PARTS = [{'@id': "/api/parts/{}".format(i)} for i in range(1, 5)]
+
+
+def test_select_parts_without_filters(tmp_path):
+    journal = SyncJournal(str(tmp_path / "journal"))
+    journal.record(PARTS[0], 'ok')
+    assert journal.select_parts(PARTS) == PARTS
+    journal.close()
+
+
+def test_select_parts_resumes_unfinished_run(tmp_path):
+    journal = SyncJournal(str(tmp_path / "journal"))
+    journal.record(PARTS[0], 'ok')
+    journal.start_run()
+    journal.record(PARTS[1], 'ok')
+    journal.record(PARTS[2], 'error')
+    # Part 1 was synced before the run started, part 3 failed
+    assert journal.select_parts(PARTS, resume=True) == [PARTS[0], PARTS[2], PARTS[3]]
+    
+    journal.finish_run()
+    assert journal.select_parts(PARTS, resume=True) == PARTS
+    journal.close()
+
+
+def test_select_parts_stale_after(tmp_path):
+    journal = SyncJournal(str(tmp_path / "journal"))
+    journal.record(PARTS[0], 'ok')
+    journal.record(PARTS[1], 'skipped')
+    journal.record(PARTS[2], 'error')
+    assert journal.select_parts(PARTS, stale_after=3600) == [PARTS[2], PARTS[3]]
+    time.sleep(0.02)
+    assert journal.select_parts(PARTS, stale_after=0.01) == PARTS
+    journal.close()
+
+
+def test_start_run_resume_keeps_unfinished_run(tmp_path):
+    journal = SyncJournal(str(tmp_path / "journal"))
+    journal.start_run()
+    started_at = journal.run_started_at
+    journal.close()
+    
+    journal = SyncJournal(str(tmp_path / "journal"))
+    journal.start_run(resume=True)
+    assert journal.run_started_at == started_at
+    journal.close()
+
+
+def test_start_run_abandons_unfinished_run(tmp_path):
+    journal = SyncJournal(str(tmp_path / "journal"))
+    journal.start_run()
+    first_run = journal.run_started_at
+    journal.start_run()
+    assert journal.run_started_at != first_run
+    assert journal.get_unfinished_run() == journal.run_started_at
+    journal.finish_run()
+    assert journal.get_unfinished_run() is None
+    journal.close()
+
+
+def test_parts_synced_outside_a_run_leave_it_resumable(tmp_path):
+    journal = SyncJournal(str(tmp_path / "journal"))
+    journal.start_run()
+    started_at = journal.run_started_at
+    journal.close()
+    
+    # e.g. a sync of a single part after the full sync was interrupted
+    journal = SyncJournal(str(tmp_path / "journal"))
+    journal.record(PARTS[0], 'ok')
+    journal.finish_run()
+    assert journal.get_unfinished_run() == started_at
+    assert journal.select_parts(PARTS, resume=True) == PARTS[1:]
+    journal.close()
@@ -0,0 +1,64 @@
+import threading
+import time
+
+from write_queue import WriteQueue
+
+
+def test_same_key_runs_in_submission_order():
+    queue = WriteQueue(workers=4)
+    order = []
+    
+    def write(i):
+        # Earlier writes take longer, so a reordering would show
+        time.sleep(0.01 * (5 - i))
+        order.append(i)
+        return {'@id': i}
+    
+    futures = [queue.submit("/api/parts/1", write, i) for i in range(5)]
+    assert queue.join() == []
+    assert order == list(range(5))
+    assert [future.result()['@id'] for future in futures] == list(range(5))
+    queue.close()
+
+
+def test_different_keys_run_concurrently():
+    queue = WriteQueue(workers=2)
+    barrier = threading.Barrier(2, timeout=5)
+    
+    def write():
+        # Only returns once both writes are running at the same time
+        barrier.wait()
+        return {'@id': 1}
+    
+    queue.submit("/api/parts/1", write)
+    queue.submit("/api/parts/2", write)
+    assert queue.join() == []
+    queue.close()
+
+
+def test_failures_are_collected():
+    queue = WriteQueue(workers=2)
+    
+    def fail():
+        raise ValueError("rejected")
+    
+    queue.submit("/api/parts/1", fail, description="part 1")
+    queue.submit("/api/parts/1", lambda: {'hydra:description': "invalid"}, description="part 1 again")
+    queue.submit("/api/parts/2", lambda: {'@id': 2})
+    failures = queue.join()
+    assert [(description, str(error)) for description, error in failures] == [("part 1", "rejected"), ("part 1 again", "invalid")]
+    assert queue.join() == []
+    queue.close()
+
+
+def test_failed_submit_is_not_waited_for():
+    queue = WriteQueue(workers=1)
+    queue.executor.shutdown()
+    try:
+        queue.submit("/api/parts/1", lambda: {'@id': 1})
+        assert False, "submit after shutdown should raise"
+    except RuntimeError:
+        pass
+    assert queue.queues == {}
+    # Returns at once instead of waiting for the operation that never ran
+    assert queue.join() == []
@@ -1,16 +1,26 @@
 import base64
 import hmac
-import requests
 import urllib.parse
 
 from hashlib import sha1
 
+from transport import InstrumentedSession
+
 
 class TME:
-    def __init__(self, app_key, app_secret):
-        self.base_url = "https://api.tme.eu"
+    # Can be pointed at a stand-in server, e.g. by the benchmark
+    BASE_URL = "https://api.tme.eu"
+    
+    # Maximum number of symbols the API accepts in a single SymbolList
+    MAX_SYMBOLS = 50
+    
+    def __init__(self, app_key, app_secret, rate_limiter=None, cache=None, pool_size=8, timeout=30):
+        self.base_url = self.BASE_URL
         self.app_key = app_key
         self.app_secret = app_secret
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        self.session = InstrumentedSession(pool_size=pool_size, timeout=timeout, retry_all_methods=True)
     
     def calculate_signature(self, method, url, params):
         sorted_params = sorted(list(params.items()))
@@ -24,19 +34,84 @@ class TME:
         params['Token'] = self.app_key
         signature = self.calculate_signature("POST", full_url, params)
         params['ApiSignature'] = signature
-        resp = requests.post(full_url, data=params)
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+        resp = self.session.post(full_url, data=params)
         if resp.status_code != 200:
             return None
         return resp.json()
     
+    def cached_api_call(self, kind, url, params, order_no):
+        # Single-symbol call, the ProductList entry is cached per symbol
+        if self.cache:
+            product = self.cache.get("TME", kind, order_no.upper())
+            if product is not None:
+                return {'Status': "OK", 'Data': {'ProductList': [product]}}
+        params["SymbolList[0]"] = order_no
+        data = self.api_call(url, params)
+        if self.cache and data is not None and 'Error' not in data and data['Data']['ProductList']:
+            self.cache.put("TME", kind, order_no.upper(), data['Data']['ProductList'][0])
+        return data
+    
     def get_part_details(self, order_no):
-        data = self.api_call("/Products/GetProducts.json", {"Country": "DE", "Language": "EN", "SymbolList[0]": order_no})
+        data = self.cached_api_call('details', "/Products/GetProducts.json", {"Country": "DE", "Language": "EN"}, order_no)
         return data
     
     def get_part_prices(self, order_no):
-        data = self.api_call("/Products/GetPrices.json", {"Country": "DE", "Language": "EN", "Currency": "EUR", "SymbolList[0]": order_no})
+        data = self.cached_api_call('prices', "/Products/GetPrices.json", {"Country": "DE", "Language": "EN", "Currency": "EUR"}, order_no)
         return data
     
     def get_part_parameters(self, order_no):
-        data = self.api_call("/Products/GetParameters.json", {"Country": "DE", "Language": "EN", "SymbolList[0]": order_no})
+        data = self.cached_api_call('parameters', "/Products/GetParameters.json", {"Country": "DE", "Language": "EN"}, order_no)
         return data
+    
+    def batch_api_call(self, url, params, order_nos):
+        # Returns the ProductList entries of all chunks keyed by symbol, or None if every chunk failed.
+        # The symbols of a failed chunk are missing from the result, the other chunks are still used.
+        results = {}
+        starts = range(0, len(order_nos), self.MAX_SYMBOLS)
+        failed_chunks = 0
+        for start in starts:
+            chunk = order_nos[start:start + self.MAX_SYMBOLS]
+            chunk_params = dict(params)
+            for i, order_no in enumerate(chunk):
+                chunk_params["SymbolList[{}]".format(i)] = order_no
+            data = self.api_call(url, chunk_params)
+            if data is None or 'Error' in data:
+                print("        TME API Error for {} symbols starting at {}!".format(len(chunk), chunk[0]))
+                failed_chunks += 1
+                continue
+            for product in data['Data']['ProductList']:
+                results[product['Symbol']] = product
+        if starts and failed_chunks == len(starts):
+            return None
+        return results
+    
+    def cached_batch_api_call(self, kind, url, params, order_nos):
+        # Only symbols without a fresh cache entry are requested from the API
+        results = {}
+        missing = []
+        for order_no in order_nos:
+            product = self.cache.get("TME", kind, order_no.upper()) if self.cache else None
+            if product is None:
+                missing.append(order_no)
+            else:
+                results[product['Symbol']] = product
+        if missing:
+            fetched = self.batch_api_call(url, params, missing)
+            if fetched is None:
+                return None
+            for symbol, product in fetched.items():
+                if self.cache:
+                    self.cache.put("TME", kind, symbol.upper(), product)
+                results[symbol] = product
+        return results
+    
+    def get_parts_details(self, order_nos):
+        return self.cached_batch_api_call('details', "/Products/GetProducts.json", {"Country": "DE", "Language": "EN"}, order_nos)
+    
+    def get_parts_prices(self, order_nos):
+        return self.cached_batch_api_call('prices', "/Products/GetPrices.json", {"Country": "DE", "Language": "EN", "Currency": "EUR"}, order_nos)
+    
+    def get_parts_parameters(self, order_nos):
+        return self.cached_batch_api_call('parameters', "/Products/GetParameters.json", {"Country": "DE", "Language": "EN"}, order_nos)
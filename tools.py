@@ -1,11 +1,7 @@
 import argparse
-import code128
 import csv
-import time
 
 from collections import defaultdict
-from PIL import Image, ImageDraw, ImageFont
-from pprint import pprint
 
 from secrets import *
 from tme import TME
@@ -13,7 +9,18 @@ from mouser import Mouser
 from digikey import DigiKey
 from lcsc import LCSC
 from partkeepr import PartKeepr
-from distributor_common import SUPPORTED_DISTRIBUTORS, get_part_data
+from catalog import Catalog
+from response_cache import ResponseCache
+from distributor_common import get_rate_limiter
+from sync import DistributorSync, SyncJournal
+from labels import LABEL_FORMATS, RENDERED_LABEL_FORMATS, LabelGeometry, LabelManifest, get_label_jobs
+
+
+def print_write_failures(failures):
+    if failures:
+        print("Failed writes:")
+        for description, error in failures:
+            print("  {}: {}".format(description, error))
 
 
 def main():
@@ -21,6 +28,9 @@ def main():
     parser.add_argument("-a", "--action", type=str, required=True, choices=('sync-distributors', 'list-empty-part-mf', 'update-locations-from-csv', 'generate-labels', 'rename-from-params', 'update-project-from-csv', 'check-stock-from-csv'), help="Which action to perform")
     parser.add_argument("-f", "--force", action='store_true', help="Force certain actions")
     parser.add_argument("-o", "--offset", type=int, required=False, help="Offset into parts list (how many parts to skip)")
+    parser.add_argument("--journal", type=str, required=False, default=".syncjournal", help="For distributor sync: Checkpoint journal file")
+    parser.add_argument("--resume", action='store_true', help="For distributor sync: Resume the last interrupted sync, skipping completed parts")
+    parser.add_argument("--stale-after", type=float, required=False, help="For distributor sync: Only sync parts last synced more than n hours ago")
     parser.add_argument("--id", type=int, required=False, help="Single part ID")
     parser.add_argument("--location", type=str, required=False, help="Single storage location name")
     parser.add_argument("--name-column", type=str, required=False, help="For CSV import: Name column name")
@@ -35,17 +45,45 @@ def main():
     parser.add_argument("--label-dpi", type=int, required=False, help="For label generation: Label resolution in dpi")
     parser.add_argument("--font-size", type=int, required=False, help="For label generation: Font size")
     parser.add_argument("--max-parts-per-label", type=int, required=False, help="For label generation: Only generate label for maximum of n parts")
-    parser.add_argument("--label-file", type=str, required=False, help="For label generation: Label PDF file name")
+    parser.add_argument("--label-file", type=str, required=False, help="For label generation: Output file name, or tcp://host[:port] to send ZPL formats straight to a printer")
+    parser.add_argument("--label-format", type=str, required=False, default='pdf-raster', choices=tuple(LABEL_FORMATS), help="For label generation: Output format (pdf-vector has sharp barcodes at any printer resolution, zpl text uses the printer font so its layout is approximate, zpl-raster matches the PDF)")
+    parser.add_argument("--label-manifest", type=str, required=False, help="For label generation: Manifest file remembering the content of every generated label")
+    parser.add_argument("--changed-only", action='store_true', help="For label generation: Only generate labels that changed since the last run (requires --label-manifest)")
+    parser.add_argument("--label-cache", type=str, required=False, help="For label generation: File to keep rendered barcodes and texts in between runs (raster formats only)")
+    parser.add_argument("--label-workers", type=int, required=False, help="For label generation: Number of rendering processes (raster formats only, default: number of CPUs)")
     parser.add_argument("--project-id", type=int, required=False, help="For project CSV import: Internal project ID (integer)")
     parser.add_argument("--num-boards", type=int, required=False, help="For stock check: Desired number of boards")
+    parser.add_argument("--fetch-workers", type=int, required=False, default=2, help="For distributor sync: Concurrent requests per distributor")
+    parser.add_argument("--partial-updates", action='store_true', help="Only send the changed fields when updating entities (checked on the first update, full entities are sent if the server resets the omitted fields)")
+    parser.add_argument("--write-workers", type=int, required=False, default=4, help="Concurrent PartKeepr writes for bulk updates")
+    parser.add_argument("--cache", type=str, required=False, help="Local catalog cache file (SQLite), the actions read from it and write through to it")
+    parser.add_argument("--cache-max-age", type=float, required=False, help="Re-read the local catalog cache from the server if it is older than n hours (only changed entries are rewritten)")
+    parser.add_argument("--refresh", action='store_true', help="Fully re-download the local catalog cache")
+    parser.add_argument("--stats", action='store_true', help="Print API latency and traffic statistics when done")
+    parser.add_argument("--compact", action='store_true', help="Keep parts as compact records to save memory on large catalogs")
+    parser.add_argument("--api-cache", type=str, required=False, help="Distributor API response cache file (SQLite)")
+    parser.add_argument("--api-cache-bypass", action='store_true', help="Ignore cached distributor API responses (fresh responses are still stored)")
     args = parser.parse_args()
     
-    pk = PartKeepr(PK_BASE_URL, PK_USERNAME, PK_PASSWORD)
-    tme = TME(TME_APP_KEY, TME_APP_SECRET)
-    mouser = Mouser(MOUSER_API_KEY)
-    digikey = DigiKey(DIGIKEY_CLIENT_ID, DIGIKEY_CLIENT_SECRET)
-    lcsc = LCSC()
+    catalog = Catalog(args.cache) if args.cache else None
+    pk = PartKeepr(PK_BASE_URL, PK_USERNAME, PK_PASSWORD, catalog=catalog, compact=args.compact, write_workers=args.write_workers, partial_updates=args.partial_updates)
+    if catalog:
+        print("Syncing local catalog")
+        pk.sync_catalog(full=args.refresh, max_age=args.cache_max_age * 3600 if args.cache_max_age is not None else None)
+    api_cache = ResponseCache(args.api_cache, bypass=args.api_cache_bypass) if args.api_cache else None
+    tme = TME(TME_APP_KEY, TME_APP_SECRET, rate_limiter=get_rate_limiter("TME"), cache=api_cache)
+    mouser = Mouser(MOUSER_API_KEY, rate_limiter=get_rate_limiter("Mouser"), cache=api_cache)
+    digikey = DigiKey(DIGIKEY_CLIENT_ID, DIGIKEY_CLIENT_SECRET, rate_limiter=get_rate_limiter("Digi-Key"), cache=api_cache)
+    lcsc = LCSC(rate_limiter=get_rate_limiter("LCSC"), cache=api_cache)
     
+    try:
+        run_action(args, pk, tme, mouser, digikey, lcsc)
+    finally:
+        # Waits for queued writes and stops the write workers
+        pk.close()
+
+
+def run_action(args, pk, tme, mouser, digikey, lcsc):
     if args.action == 'sync-distributors':
         if args.id:
             print("Getting part")
@@ -54,37 +92,24 @@ def main():
             print("Getting parts")
             parts = pk.get_parts()
         
-        print("Getting manufacturers")
-        manufacturers = pk.get_manufacturers()
-        manufacturer_ids_by_name = dict([(mf['name'].lower(), mf['@id']) for mf in manufacturers])
-        
         if args.offset:
             parts = parts[args.offset:]
         
-        num_parts = len(parts)
-        errors = []
-        for i, part in enumerate(parts):
-            print("  [{: 5d}/{: 5d}] Processing {}".format(i+1, num_parts, part['name']))
-            
-            part_distributors = part['distributors']
-            part_manufacturers = part['manufacturers']
-            part_manufacturer_ids_by_name = dict([(mf['manufacturer']['name'].lower(), mf['@id']) for mf in part_manufacturers])
-            
-            for distributor in part_distributors:
-                distributor_name = distributor['distributor']['name']
-                if distributor_name not in SUPPORTED_DISTRIBUTORS.values():
-                    print("    Skipping distributor {}".format(distributor_name))
-                    continue
-                
-                print("    Processing distributor {}".format(distributor_name))
-                order_no = distributor['orderNumber']
-                part_data = get_part_data(distributor_name, order_no, tme, mouser, digikey, lcsc)
-                if not part_data:
-                    print("      Failed to get part data!")
-                    errors.append(part['name'])
-                    continue
-                part = pk.update_part_data(part, part_data, distributor, manufacturer_ids_by_name)
-            time.sleep(0.2) # To ensure we don't exceed 5 API calls per second
+        journal = SyncJournal(args.journal)
+        stale_after = args.stale_after * 3600 if args.stale_after is not None else None
+        parts = journal.select_parts(parts, resume=args.resume, stale_after=stale_after)
+        if not args.id and not args.offset and stale_after is None:
+            # Only syncs of all parts are runs that can be resumed, syncing a few parts in between
+            # leaves an interrupted run alone (the synced parts are still recorded)
+            journal.start_run(resume=args.resume)
+        
+        if any([distributor['distributor']['name'] == "Digi-Key" for part in parts for distributor in part['distributors']]):
+            # The sync looks parts up from worker threads, which cannot ask for an authorization code
+            digikey.authorize()
+        
+        sync = DistributorSync(pk, tme, mouser, digikey, lcsc, fetch_workers=args.fetch_workers, write_workers=args.write_workers, journal=journal)
+        errors = sync.run(parts, pk.reference_data.get_ids_by_name("manufacturers"))
+        print("Skipped {} unchanged writes".format(pk.avoided_writes))
         
         if errors:
             print("Parts with errors:")
@@ -117,11 +142,7 @@ def main():
             print("Getting parts")
             parts = pk.get_parts()
         
-        part_indices_by_name = dict([(part['name'].lower(), index) for index, part in enumerate(parts)])
-        
-        print("Getting storage locations")
-        locations = pk.get_storage_locations()
-        location_ids_by_name = dict([(loc['name'].lower(), loc['@id']) for loc in locations])
+        index = pk.get_part_index(parts)
         
         entries = []
         with open(args.csv_file, 'r', encoding='utf-8') as f:
@@ -136,105 +157,68 @@ def main():
                 location = args.default_location
             print("Processing {} located in {}".format(name, location))
             
-            if name.lower() not in part_indices_by_name:
+            part = index.find_by_name(name)
+            if part is None:
                 print("  Could not find part in database, skipping")
                 continue
             
-            part_index = part_indices_by_name[name.lower()]
-            part = parts[part_index]
             if part['storageLocation'] and not args.force:
                 print("  Part already has storage location assigned, skipping (use -f to override)")
                 continue
             
-            if location.lower() in location_ids_by_name:
+            loc_id = pk.reference_data.get_id("storage_locations", location)
+            if loc_id:
                 print("  Found location in database")
-                loc_id = location_ids_by_name[location.lower()]
             else:
                 print("  Creating location")
                 loc_new = {'name': location, 'category': {'@id': "/api/storage_location_categories/1"}}
                 result = pk.create_storage_location(loc_new)
+                # The reference data picks up the new location from the result
                 loc_id = result['@id']
-                location_ids_by_name[location.lower()] = loc_id
             
             print("  Updating part")
             part['storageLocation'] = {'@id': loc_id}
-            result = pk.update_part(part)
+            pk.queue_write(part['@id'], pk.update_part, part, ['storageLocation'], description=name)
+        
+        print_write_failures(pk.wait_for_writes())
     
     elif args.action == 'generate-labels':
         if not args.label_width or not args.label_height or not args.label_dpi or not args.font_size or not args.max_parts_per_label or not args.label_file:
             print("Error: Missing parameters!")
             return
         
-        label_width_px = round((args.label_width / 25.4) * args.label_dpi)
-        label_height_px = round((args.label_height / 25.4) * args.label_dpi)
+        render_options = {}
+        if args.label_workers is not None:
+            render_options['workers'] = args.label_workers
+        if args.label_cache is not None:
+            render_options['cache_file'] = args.label_cache
+        if render_options and args.label_format not in RENDERED_LABEL_FORMATS:
+            print("Error: --label-workers and --label-cache are only supported for {}!".format(", ".join(RENDERED_LABEL_FORMATS)))
+            return
+        
+        geometry = LabelGeometry(args.label_width, args.label_height, args.label_dpi, args.font_size)
         
         print("Getting parts")
-        parts = pk.get_parts()
-        parts_by_location = {}
-        
-        for part in parts:
-            if not part['storageLocation']:
-                continue
-            loc_name = part['storageLocation']['name']
-            if loc_name in parts_by_location:
-                parts_by_location[loc_name].append(part)
-            else:
-                parts_by_location[loc_name] = [part]
+        index = pk.get_part_index()
         
-        labels = []
-        font = ImageFont.truetype("LiberationSans-Regular.ttf", args.font_size)
-        for loc_name, parts in sorted(parts_by_location.items(), key=lambda e: e[0]):
-            if args.location and loc_name.lower() != args.location.lower():
-                continue
-            
-            if len(parts) > args.max_parts_per_label:
-                print("Skipping storage location {}: {} parts".format(loc_name, len(parts)))
-                continue
-            print("Processing storage location {}: {} parts".format(loc_name, len(parts)))
-            
-            img = Image.new("RGB", (label_width_px, label_height_px), 'white')
-            draw = ImageDraw.Draw(img)
-            
-            margin = round(max(label_height_px * 0.02, label_width_px * 0.02))
-            avail_label_height = label_height_px - 2 * margin
-            avail_label_width = label_width_px - 2 * margin
-            
-            # Split label into base grid with fixed height location tag and variable height parts areas
-            base_x = margin
-            loc_area_y = margin
-            loc_area_height = round(args.font_size * 1.5)
-            parts_area_y = loc_area_y + loc_area_height
-            parts_area_height = avail_label_height - loc_area_height
-            
-            # Split parts area into evenly-spaced grid
-            parts_area_region_height = parts_area_height // len(parts)
-            parts_area_regions_y = []
-            for i in range(len(parts)):
-                region_y = parts_area_y + parts_area_region_height * i
-                parts_area_regions_y.append(region_y)
-            
-            draw.text((base_x, loc_area_y), "Location: {}".format(loc_name), 'black', font=font)
-            
-            for i, part in enumerate(sorted(parts, key=lambda p: p['@id'])):
-                barcode_text = "{}: {}".format(part['category']['name'], part['name'])
-                
-                part_id = part['@id'].split("/")[-1]
-                barcode_height = parts_area_region_height - round(args.font_size * 1.5)
-                barcode_thickness = avail_label_width // 100
-                
-                barcode = code128.image("P" + part_id, height=barcode_height, thickness=barcode_thickness, quiet_zone=False)
-                barcode_x = (avail_label_width - (barcode.size[0])) // 2
-                barcode_y = parts_area_regions_y[i]
-                img.paste(barcode, (barcode_x, barcode_y))
-                
-                name_x = barcode_x
-                name_y = barcode_y + barcode_height + args.font_size * 0.1
-                draw.text((name_x, name_y), barcode_text, 'black', font=font)
-            
-            labels.append(img)
+        jobs = get_label_jobs(index, args.max_parts_per_label, args.location)
+        manifest = LabelManifest(args.label_manifest) if args.label_manifest else None
+        if args.changed_only:
+            if manifest is None:
+                print("Error: --changed-only requires --label-manifest!")
+                return
+            jobs = manifest.get_changed(jobs, geometry)
+            print("{} labels changed since the last run".format(len(jobs)))
+        if not jobs:
+            print("No labels to generate")
+            return
         
-        print("Generating PDF")
-        labels[0].save(args.label_file, "PDF", resolution=args.label_dpi, save_all=True, append_images=labels[1:])
+        print("Generating {}".format(args.label_format))
+        LABEL_FORMATS[args.label_format](args.label_file, jobs, geometry, **render_options)
+        if manifest is not None:
+            # A run over all locations replaces the manifest, so removed locations don't linger in it
+            manifest.update(jobs, geometry, prune=not args.changed_only and not args.location)
+            manifest.save()
     
     elif args.action == 'rename-from-params':
         if args.id:
@@ -279,7 +263,9 @@ def main():
             if accept:
                 print("    Updating part")
                 part['name'] = new_name
-                result = pk.update_part(part)
+                pk.queue_write(part['@id'], pk.update_part, part, ['name'], description=new_name)
+        
+        print_write_failures(pk.wait_for_writes())
     
     elif args.action == 'update-project-from-csv':
         if not args.order_no_column or not args.qty_column or not args.refs_column or not args.csv_file or not args.project_id:
@@ -290,13 +276,7 @@ def main():
         project = pk.get_project(args.project_id)
         
         print("Getting parts")
-        parts = pk.get_parts()
-        
-        part_indices_by_order_no = {}
-        for index, part in enumerate(parts):
-            if part['distributors']:
-                for distributor in part['distributors']:
-                    part_indices_by_order_no[distributor['orderNumber']] = index
+        index = pk.get_part_index()
         
         entries = []
         with open(args.csv_file, 'r', encoding='utf-8') as f:
@@ -310,13 +290,11 @@ def main():
             refs = entry[args.refs_column]
             print("Processing {} ({})".format(order_no, refs))
             
-            if order_no not in part_indices_by_order_no:
+            part = index.find_by_order_no(order_no)
+            if part is None:
                 print("  Could not find part in database, skipping")
                 continue
             
-            part_index = part_indices_by_order_no[order_no]
-            part = parts[part_index]
-            
             project['parts'].append({
                 'part': {
                     '@id': part['@id']
@@ -335,13 +313,7 @@ def main():
             return
         
         print("Getting parts")
-        parts = pk.get_parts()
-        
-        part_indices_by_order_no = {}
-        for index, part in enumerate(parts):
-            if part['distributors']:
-                for distributor in part['distributors']:
-                    part_indices_by_order_no[distributor['orderNumber']] = index
+        index = pk.get_part_index()
         
         entries = []
         with open(args.csv_file, 'r', encoding='utf-8') as f:
@@ -355,7 +327,8 @@ def main():
             qty = args.num_boards * int(entry[args.qty_column])
             print("Processing {}".format(order_no))
             
-            if order_no not in part_indices_by_order_no:
+            part = index.find_by_order_no(order_no)
+            if part is None:
                 print("  Could not find part in database, skipping")
                 parts_status[order_no] = {
                     'status': 'missing',
@@ -366,17 +339,11 @@ def main():
                 }
                 continue
             
-            part_index = part_indices_by_order_no[order_no]
-            part = parts[part_index]
-            
             print("  Stock:    {}".format(part['stockLevel']))
             print("  Required: {}".format(qty))
             
-            distributor_name = ""
-            for distributor in part['distributors']:
-                if distributor['orderNumber'] == order_no:
-                    distributor_name = distributor['distributor']['name']
-                
+            distributor_name = index.get_part_distributor(part, order_no)['distributor']['name']
+            
             if order_no not in parts_status:
                 parts_status[order_no] = {
                     'distributor': distributor_name,
@@ -404,6 +371,13 @@ def main():
         for order_no, status in parts_status.items():
             if status['status'] == 'available':
                 print("{}: {}".format(order_no, status['status_text']))
+    
+    if args.stats:
+        for name, session in (("PartKeepr", pk.session), ("TME", tme.session), ("Mouser", mouser.session), ("Digi-Key", digikey.session), ("LCSC", lcsc.session)):
+            if session.stats.endpoints:
+                print("")
+                print(name)
+                print(session.stats.report())
 
 if __name__ == "__main__":
     main()
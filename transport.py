@@ -0,0 +1,115 @@
+import re
+import requests
+import threading
+import time
+import urllib.parse
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class TransportStats:
+    # Per-endpoint request counts, latency histograms and byte counters
+    BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float('inf'))
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+    
+    @staticmethod
+    def get_endpoint(method, url):
+        # https://host/api/parts/123?page=2 -> GET /api/parts/{id}
+        path = urllib.parse.urlsplit(url).path
+        path = re.sub(r"/\d+(?=/|$)", "/{id}", path)
+        return "{} {}".format(method.upper(), path)
+    
+    def record(self, method, url, elapsed, sent, received, failed):
+        endpoint = self.get_endpoint(method, url)
+        with self.lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = {
+                    'count': 0,
+                    'failed': 0,
+                    'total_time': 0.0,
+                    'max_time': 0.0,
+                    'sent': 0,
+                    'received': 0,
+                    'histogram': [0] * len(self.BUCKETS)
+                }
+            stats['count'] += 1
+            stats['failed'] += 1 if failed else 0
+            stats['total_time'] += elapsed
+            stats['max_time'] = max(stats['max_time'], elapsed)
+            stats['sent'] += sent
+            stats['received'] += received
+            for i, limit in enumerate(self.BUCKETS):
+                if elapsed <= limit:
+                    stats['histogram'][i] += 1
+                    break
+    
+    def get_percentile(self, histogram, count, percentile):
+        # Upper bound of the bucket containing the percentile
+        target = count * percentile
+        seen = 0
+        for i, num in enumerate(histogram):
+            seen += num
+            if seen >= target:
+                return self.BUCKETS[i]
+        return self.BUCKETS[-1]
+    
+    def report(self):
+        lines = ["{:<45} {:>7} {:>6} {:>9} {:>9} {:>9} {:>11} {:>11}".format("Endpoint", "Calls", "Fail", "Mean [s]", "p50 [s]", "p95 [s]", "Sent [B]", "Recv [B]")]
+        with self.lock:
+            endpoints = sorted(self.endpoints.items(), key=lambda e: e[1]['total_time'], reverse=True)
+            for endpoint, stats in endpoints:
+                lines.append("{:<45} {:>7} {:>6} {:>9.3f} {:>9} {:>9} {:>11} {:>11}".format(
+                    endpoint,
+                    stats['count'],
+                    stats['failed'],
+                    stats['total_time'] / stats['count'],
+                    "<={}".format(self.get_percentile(stats['histogram'], stats['count'], 0.5)),
+                    "<={}".format(self.get_percentile(stats['histogram'], stats['count'], 0.95)),
+                    stats['sent'],
+                    stats['received']))
+        return "\n".join(lines)
+
+
+class InstrumentedSession(requests.Session):
+    # Session with a keep-alive connection pool sized for concurrent use, retries with backoff
+    # on 429/5xx responses (honouring Retry-After) and connection errors, and per-endpoint statistics.
+    # Only idempotent methods are retried unless retry_all_methods is set, which is meant
+    # for APIs where POST is just a lookup. With connect_retries_only set, requests are only
+    # retried if they never reached the server, for non-idempotent actions sent with any method.
+    # The session is shared between threads; urllib3 hands each concurrent request its own pooled connection.
+    def __init__(self, pool_size=16, retries=3, backoff_factor=0.5, timeout=60, stats=None, retry_all_methods=False, connect_retries_only=False):
+        super().__init__()
+        self.timeout = timeout
+        self.stats = stats or TransportStats()
+        if connect_retries_only:
+            retry = Retry(total=retries, connect=retries, read=0, status=0, other=0, backoff_factor=backoff_factor, allowed_methods=False, raise_on_status=False)
+        else:
+            allowed_methods = False if retry_all_methods else Retry.DEFAULT_ALLOWED_METHODS
+            retry = Retry(total=retries, connect=retries, read=retries, status=retries, backoff_factor=backoff_factor, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=allowed_methods, raise_on_status=False, respect_retry_after_header=True)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+        self.headers['Accept-Encoding'] = "gzip, deflate"
+    
+    def request(self, method, url, *args, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        start = time.monotonic()
+        try:
+            resp = super().request(method, url, *args, **kwargs)
+        except requests.RequestException:
+            self.stats.record(method, url, time.monotonic() - start, 0, 0, True)
+            raise
+        if kwargs.get('stream'):
+            # Streamed bodies are left to the caller, only the headers are measured
+            received = int(resp.headers.get('Content-Length', 0))
+        else:
+            # Reading content here includes the body transfer in the measured time (sizes are after decompression)
+            received = len(resp.content)
+        sent = len(resp.request.body or b"")
+        self.stats.record(method, url, time.monotonic() - start, sent, received, resp.status_code >= 400)
+        return resp
@@ -0,0 +1,89 @@
+import threading
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class WriteQueue:
+    # Runs mutations on a pool of workers. Operations submitted with the same key (usually the
+    # @id of the resource they change) run one after the other in submission order, operations
+    # on different keys run concurrently. A failing operation is recorded in 'failures' as
+    # (description, error) instead of aborting the others; a result without an @id counts as
+    # failed since that is how the API reports rejected writes. Nothing is printed here, the
+    # failures are reported by the caller after join() so they don't interleave with its output.
+    def __init__(self, workers=8):
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        # Operations waiting behind the running one, per key
+        self.queues = {}
+        self.num_pending = 0
+        self.failures = []
+    
+    def submit(self, key, func, *args, description=None, **kwargs):
+        future = Future()
+        item = (future, func, args, kwargs, description or key)
+        with self.lock:
+            self.num_pending += 1
+            queue = self.queues.get(key)
+            if queue is not None:
+                queue.append(item)
+                return future
+            self.queues[key] = deque()
+        try:
+            self.executor.submit(self.run, key, item)
+        except Exception as e:
+            # E.g. after shutdown: nothing will run this key, so neither this operation nor the
+            # ones queued behind it in the meantime must be waited for
+            with self.lock:
+                queued = self.queues.pop(key)
+                self.num_pending -= 1 + len(queued)
+                self.idle.notify_all()
+            for queued_item in queued:
+                queued_item[0].set_exception(e)
+            raise
+        return future
+    
+    def run(self, key, item):
+        # Works through the operations of one key, later ones are picked up by the same worker
+        while item is not None:
+            self.execute(*item)
+            with self.lock:
+                self.num_pending -= 1
+                queue = self.queues[key]
+                if queue:
+                    item = queue.popleft()
+                else:
+                    del self.queues[key]
+                    item = None
+                self.idle.notify_all()
+    
+    def execute(self, future, func, args, kwargs, description):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self.add_failure(description, e)
+            future.set_exception(e)
+            return
+        if isinstance(result, dict) and '@id' not in result:
+            self.add_failure(description, result.get('hydra:description', result))
+        future.set_result(result)
+    
+    def add_failure(self, description, error):
+        with self.lock:
+            self.failures.append((description, error))
+    
+    def join(self):
+        # Waits until all submitted operations are done and returns the failures collected so far
+        with self.lock:
+            while self.num_pending:
+                self.idle.wait()
+            failures = self.failures
+            self.failures = []
+        return failures
+    
+    def close(self):
+        self.join()
+        self.executor.shutdown(wait=True)